@@ -33,6 +33,15 @@ doctype_js = {
 doc_events = {
     "Sales Invoice": {
         "on_submit": "shreerakhi_customizations.api.invoice_api.generate_public_access_key"
+    },
+    # Keep the item image fingerprint index current
+    "Item": {
+        "on_update": "shreerakhi_customizations.shree.image_index.on_item_change",
+        "on_trash": "shreerakhi_customizations.shree.image_index.on_item_trash"
+    },
+    # Downscale oversized Item Image Scanner photos once after upload
+    "File": {
+        "after_insert": "shreerakhi_customizations.shree.image_upload.on_file_insert"
     }
 }
 
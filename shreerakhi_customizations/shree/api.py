@@ -6,385 +6,299 @@ Path: shreerakhi_customizations/shree/api.py
 
 import frappe
 import hashlib
-import requests
-from PIL import Image
-from io import BytesIO
+import numpy as np
+import time
 
-# Try to import imagehash, fallback to None
-try:
-    import imagehash
-    IMAGEHASH_AVAILABLE = True
-    frappe.logger().info("✓ imagehash library available - using advanced matching")
-except ImportError:
-    IMAGEHASH_AVAILABLE = False
-    frappe.logger().info("✗ imagehash not available - using PIL-only matching")
+from shreerakhi_customizations.shree import image_features
+from shreerakhi_customizations.shree.image_features import ImageFingerprint
+from shreerakhi_customizations.shree.image_cache import get_thumbnail
+from shreerakhi_customizations.shree.image_hashing import IMAGEHASH_AVAILABLE
+
+DEFAULT_WAREHOUSE_CACHE_KEY = "image_match_default_warehouse"
+DEFAULT_WAREHOUSE_CACHE_TTL = 5 * 60
+
+# Streaming scans: realtime event and minimum seconds between partial updates
+SCAN_PROGRESS_EVENT = "image_scan_progress"
+SCAN_PROGRESS_INTERVAL = 0.5
+MATCH_LIMIT = 20
+
+# Ranked results of indexed scans, keyed on upload content + index version
+RESULT_CACHE_PREFIX = "image_match_result"
+DEFAULT_RESULT_CACHE_TTL = 60 * 60
+RESULT_CACHE_FIELDS = ("item_code", "item_name", "item_group", "image", "match_percentage")
+
+
+class ScanStream:
+    """Partial top-K and progress of one scan, published over realtime"""
+    
+    def __init__(self, scan_id, total):
+        self.scan_id = scan_id
+        self.total = total
+        self.last_published = 0
+    
+    def due(self):
+        return time.monotonic() - self.last_published >= SCAN_PROGRESS_INTERVAL
+    
+    def publish(self, matches, processed, stage, done=False):
+        """matches: enriched result rows, best first"""
+        self.last_published = time.monotonic()
+        frappe.publish_realtime(
+            SCAN_PROGRESS_EVENT,
+            {
+                "scan_id": self.scan_id,
+                "matches": matches,
+                "processed": processed,
+                "total": self.total,
+                "stage": stage,
+                "done": done,
+            },
+            user=frappe.session.user
+        )
 
 
 @frappe.whitelist()
-def match_item_by_image(image_url):
+def match_item_by_image(image_url, search_mode=None, scan_id=None,
+                        item_group=None, custom_item_range=None, custom_item_category=None):
     """
-    Hybrid image matching - auto-selects best available method
+    Hybrid image matching - auto-selects best available method (see image_engine)
+    search_mode: "brute", "mih" or "cascade" (default: site config)
+    "cascade" also applies to the full scan: a dHash-only pass shortlists
+    image_match_cascade_shortlist items and only those get the full score
+    scan_id: stream partial top-K and progress on the image_scan_progress
+    realtime event while the scan runs
+    item_group, custom_item_range, custom_item_category: only match items of
+    that group (or a group below it)/range/category (row mask over the fingerprint index)
     """
-    try:
-        # Load uploaded image
-        uploaded_img = load_image_from_url(image_url)
-        if not uploaded_img:
-            return {"success": False, "message": "Failed to load uploaded image"}
-        
-        # Get all items with images - OPTIMIZED QUERY
-        # Only fetch items where image field has actual URL (not empty/null)
-        items = frappe.db.sql("""
-            SELECT 
-                name,
-                item_code,
-                item_name,
-                image,
-                item_group
-            FROM `tabItem`
-            WHERE disabled = 0
-                AND image IS NOT NULL
-                AND image != ''
-                AND (image LIKE 'http%' OR image LIKE '/files/%')
-            ORDER BY modified DESC
-        """, as_dict=1)
-        
-        frappe.logger().info(f"Found {len(items)} items with valid images to scan")
-        
-        if not items:
-            return {"success": False, "message": "No items with images found"}
-        
-        matches = []
-        matching_method = "imagehash" if IMAGEHASH_AVAILABLE else "PIL-only"
-        scanned_count = 0
-        skipped_count = 0
-        
-        for item in items:
-            try:
-                scanned_count += 1
-                
-                # Quick validation - skip if image URL is invalid
-                if not item.image or len(item.image) < 5:
-                    skipped_count += 1
-                    continue
-                
-                # Load item image
-                item_img = load_image_from_url(item.image)
-                if not item_img:
-                    skipped_count += 1
-                    frappe.logger().debug(f"Skipped {item.item_code} - image load failed")
-                    continue
-                
-                # Calculate similarity - auto-select best method
-                if IMAGEHASH_AVAILABLE:
-                    similarity = calculate_imagehash_similarity(uploaded_img, item_img)
-                    threshold = 60  # Higher accuracy, so lower threshold
-                else:
-                    similarity = calculate_pil_similarity(uploaded_img, item_img)
-                    threshold = 65  # PIL-only needs higher threshold
-                
-                # Log for debugging
-                if similarity > 40:
-                    frappe.logger().info(f"[{matching_method}] Item: {item.item_code}, Similarity: {similarity}%")
-                
-                # Accept matches above threshold
-                if similarity >= threshold:
-                    # Get warehouse-wise stock
-                    warehouse_stock = get_item_warehouses(item.item_code)
-                    total_stock = sum(w.get('actual_qty', 0) for w in warehouse_stock)
-                    
-                    # Format warehouse details
-                    warehouse_details = []
-                    for wh in warehouse_stock:
-                        warehouse_details.append({
-                            "warehouse": wh.get('warehouse'),
-                            "qty": wh.get('actual_qty', 0),
-                            "reserved": wh.get('reserved_qty', 0),
-                            "available": wh.get('actual_qty', 0) - wh.get('reserved_qty', 0)
-                        })
-                    
-                    matches.append({
-                        "item_code": item.item_code,
-                        "item_name": item.item_name,
-                        "item_group": item.item_group or "",
-                        "match_percentage": round(similarity, 1),
-                        "stock_qty": total_stock,
-                        "image": item.image,
-                        "warehouse": get_default_warehouse(),
-                        "warehouse_stock": warehouse_details
-                    })
-                    
-            except Exception as e:
-                frappe.log_error(f"Error processing item {item.get('item_code')}: {str(e)}")
-                continue
-        
-        # Sort by similarity
-        matches.sort(key=lambda x: x["match_percentage"], reverse=True)
-        
-        return {
-            "success": True,
-            "matches": matches[:20],
-            "total_items_checked": len(items),
-            "scanned_count": scanned_count,
-            "skipped_count": skipped_count,
-            "matched_count": len(matches),
-            "matching_method": matching_method,
-            "imagehash_available": IMAGEHASH_AVAILABLE
-        }
-        
-    except Exception as e:
-        frappe.log_error(f"Image matching error: {str(e)}")
-        return {"success": False, "message": str(e)}
+    from shreerakhi_customizations.shree.image_engine import match_image
+    
+    return match_image(image_url, search_mode=search_mode, scan_id=scan_id, scope={
+        "item_group": item_group,
+        "custom_item_range": custom_item_range,
+        "custom_item_category": custom_item_category,
+    })
 
 
-def load_image_from_url(url):
+def get_scannable_items(scope=None):
     """
-    Load image from URL (local or external)
-    With basic caching to avoid repeated downloads
+    Get all items with images - OPTIMIZED QUERY
+    Only fetch items where image (or the secondary photo custom_2nd_image_link)
+    has actual URL (not empty/null)
+    scope: normalized scope ({field: [values]}, image_search.normalize_scope), filtered in SQL
     """
-    try:
-        if not url:
-            return None
-        
-        # Check cache first (session cache for same scan)
-        cache_key = f"img_cache_{hashlib.md5(url.encode()).hexdigest()}"
-        cached = frappe.cache().get_value(cache_key)
-        if cached:
-            return Image.open(BytesIO(cached))
-        
-        # External URL
-        if url.startswith("http://") or url.startswith("https://"):
-            response = requests.get(url, timeout=30, headers={'User-Agent': 'Mozilla/5.0'})
-            if response.status_code != 200:
-                return None
-            img_data = response.content
-        else:
-            # Local file
-            if "/files/" in url:
-                url = "/files/" + url.split("/files/")[-1]
-            file_path = frappe.get_site_path("public", url.lstrip("/"))
-            with open(file_path, "rb") as f:
-                img_data = f.read()
-        
-        # Cache for 5 minutes (per scan session)
-        frappe.cache().set_value(cache_key, img_data, expires_in_sec=300)
-        
-        # Load image
-        img = Image.open(BytesIO(img_data))
-        
-        # Convert to RGB
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
-        
-        return img
-        
-    except Exception as e:
-        frappe.log_error(f"Image load error: {str(e)}")
+    scope = scope or {}
+    conditions = "".join(f" AND {field} IN %({field})s" for field in scope)
+    
+    return frappe.db.sql(f"""
+        SELECT 
+            name,
+            item_code,
+            item_name,
+            image,
+            custom_2nd_image_link,
+            item_group,
+            custom_item_range,
+            custom_item_category
+        FROM `tabItem`
+        WHERE disabled = 0
+            AND (
+                image LIKE 'http%%' OR image LIKE '/files/%%'
+                OR custom_2nd_image_link LIKE 'http%%' OR custom_2nd_image_link LIKE '/files/%%'
+            ){conditions}
+        ORDER BY modified DESC
+    """, {field: tuple(values) for field, values in scope.items()}, as_dict=1)
+
+
+def get_upload_content_hash(image_url):
+    """
+    MD5 of the uploaded file (File.content_hash), None for URLs without a File
+    Same bytes give the same key before the image is even decoded
+    """
+    if not image_url or image_url.startswith("http://") or image_url.startswith("https://"):
         return None
+    return frappe.db.get_value("File", {"file_url": image_url}, "content_hash")
+
+
+def get_result_cache_key(content_hash, search_mode, scope=None):
+    """Upload content hash + fingerprint index version + search mode + scope"""
+    from shreerakhi_customizations.shree.image_index import get_index_version
+    
+    key = f"{RESULT_CACHE_PREFIX}:{get_index_version()}:{search_mode}:{content_hash}"
+    if scope:
+        key += ":" + hashlib.md5(frappe.as_json(scope).encode()).hexdigest()
+    return key
 
 
-# ============================================
-# IMAGEHASH METHOD (Best accuracy)
-# ============================================
-def calculate_imagehash_similarity(img1, img2):
+def get_cached_result(content_hash, search_mode, scope=None):
     """
-    Advanced similarity using imagehash library
-    Only called if imagehash is available
+    Cached ranking of an earlier identical scan, with stock re-fetched live
+    Entries of older index versions are never read again and expire by TTL
     """
-    try:
-        # Method 1: Average Hash - 30%
-        ahash1 = imagehash.average_hash(img1, hash_size=16)
-        ahash2 = imagehash.average_hash(img2, hash_size=16)
-        ahash_diff = ahash1 - ahash2
-        ahash_sim = max(0, 100 - (ahash_diff * 100 / 256))
-        
-        # Method 2: Perceptual Hash - 35% (MOST IMPORTANT)
-        phash1 = imagehash.phash(img1, hash_size=16)
-        phash2 = imagehash.phash(img2, hash_size=16)
-        phash_diff = phash1 - phash2
-        phash_sim = max(0, 100 - (phash_diff * 100 / 256))
-        
-        # Method 3: Difference Hash - 25%
-        dhash1 = imagehash.dhash(img1, hash_size=16)
-        dhash2 = imagehash.dhash(img2, hash_size=16)
-        dhash_diff = dhash1 - dhash2
-        dhash_sim = max(0, 100 - (dhash_diff * 100 / 256))
-        
-        # Method 4: Wavelet Hash - 10%
-        try:
-            whash1 = imagehash.whash(img1)
-            whash2 = imagehash.whash(img2)
-            whash_diff = whash1 - whash2
-            whash_sim = max(0, 100 - (whash_diff * 100 / 64))
-        except:
-            whash_sim = 0
-        
-        # Weighted average
-        final_score = (
-            ahash_sim * 0.30 +
-            phash_sim * 0.35 +
-            dhash_sim * 0.25 +
-            whash_sim * 0.10
-        )
-        
-        # Bonus for high agreement
-        if ahash_sim > 90 and phash_sim > 90 and dhash_sim > 90:
-            final_score = min(100, final_score + 5)
-        
-        return round(final_score, 2)
-        
-    except Exception as e:
-        frappe.log_error(f"imagehash similarity error: {str(e)}")
-        # Fallback to PIL method if imagehash fails
-        return calculate_pil_similarity(img1, img2)
+    cached = frappe.cache().get_value(get_result_cache_key(content_hash, search_mode, scope))
+    if not cached:
+        return None
+    
+    result = {key: value for key, value in cached.items() if key != "ranked"}
+    result["matches"] = enrich_matches([(frappe._dict(row), row["match_percentage"]) for row in cached["ranked"]])
+    result["cached"] = True
+    return result
+
+
+def cache_result(content_hash, search_mode, result, scope=None):
+    """Store an indexed scan result without its stock figures"""
+    cached = {key: value for key, value in result.items() if key != "matches"}
+    cached["ranked"] = [{key: match[key] for key in RESULT_CACHE_FIELDS} for match in result["matches"]]
+    
+    frappe.cache().set_value(
+        get_result_cache_key(content_hash, search_mode, scope),
+        cached,
+        expires_in_sec=int(frappe.conf.get("image_match_result_cache_ttl") or DEFAULT_RESULT_CACHE_TTL)
+    )
 
 
-# ============================================
-# PIL-ONLY METHOD (Fallback)
-# ============================================
-def calculate_pil_similarity(img1, img2):
+def shortlist_by_dhash(uploaded_img, photos, shortlist, stream=None):
     """
-    PIL-only similarity calculation
-    Used when imagehash is not available
+    Cascade stage 1 for the full scan: rank item photos by dHash distance alone
+    photos: [(item, image URL)], one entry per photo of an item
+    Returns (shortlisted photos, skipped count)
     """
-    try:
-        # Method 1: dHash - 35%
-        dhash_sim = dhash_similarity(img1, img2, hash_size=16)
-        
-        # Method 2: aHash - 30%
-        ahash_sim = ahash_similarity(img1, img2, hash_size=16)
-        
-        # Method 3: Histogram - 20%
-        hist_sim = histogram_similarity(img1, img2)
-        
-        # Method 4: Thumbnail - 15%
-        thumb_sim = thumbnail_similarity(img1, img2, size=(64, 64))
-        
-        # Weighted average
-        final_score = (
-            dhash_sim * 0.35 +
-            ahash_sim * 0.30 +
-            hist_sim * 0.20 +
-            thumb_sim * 0.15
-        )
-        
-        return round(final_score, 2)
-        
-    except Exception as e:
-        frappe.log_error(f"PIL similarity error: {str(e)}")
-        return 0
+    query_bits = image_features.dhash_bits(uploaded_img)
+    
+    loaded = []
+    bits = []
+    skipped_count = 0
+    for item, image_url in photos:
+        item_img = load_image_from_url(image_url)
+        if not item_img:
+            skipped_count += 1
+            continue
+        loaded.append((item, image_url))
+        bits.append(image_features.dhash_bits(item_img))
+        
+        if stream and stream.due():
+            stream.publish([], len(loaded) + skipped_count, "shortlist")
+    
+    if not loaded:
+        return [], skipped_count
+    
+    similarity = image_features.bit_similarity(query_bits, np.stack(bits))
+    order = np.argsort(-similarity, kind="stable")[:shortlist]
+    return [loaded[idx] for idx in order], skipped_count
 
 
-def dhash_similarity(img1, img2, hash_size=16):
-    """Difference Hash"""
-    try:
-        def compute_dhash(image):
-            image = image.resize((hash_size + 1, hash_size), Image.LANCZOS)
-            image = image.convert('L')
-            pixels = list(image.getdata())
-            
-            diff = []
-            for row in range(hash_size):
-                for col in range(hash_size):
-                    idx_left = row * (hash_size + 1) + col
-                    idx_right = row * (hash_size + 1) + col + 1
-                    diff.append(1 if pixels[idx_left] > pixels[idx_right] else 0)
-            
-            return ''.join(str(bit) for bit in diff)
-        
-        hash1 = compute_dhash(img1)
-        hash2 = compute_dhash(img2)
-        
-        if hash1 == hash2:
-            return 100.0
-        
-        differences = sum(c1 != c2 for c1, c2 in zip(hash1, hash2))
-        similarity = (1 - differences / len(hash1)) * 100
-        
-        return max(0, similarity)
-    except:
-        return 0
+def enrich_matches(scored_items):
+    """
+    Result rows for the final [(item, similarity)] list
+    Bin rows for all items come from one query, the default warehouse from cache
+    """
+    if not scored_items:
+        return []
+    
+    stock_by_item = get_items_warehouses([item.item_code for item, _ in scored_items])
+    default_warehouse = get_default_warehouse()
+    
+    return [
+        build_match(item, similarity, stock_by_item.get(item.item_code, []), default_warehouse)
+        for item, similarity in scored_items
+    ]
 
 
-def ahash_similarity(img1, img2, hash_size=16):
-    """Average Hash"""
-    try:
-        def compute_ahash(image):
-            image = image.resize((hash_size, hash_size), Image.LANCZOS)
-            image = image.convert('L')
-            
-            pixels = list(image.getdata())
-            avg = sum(pixels) / len(pixels)
-            
-            bits = ''.join('1' if pixel > avg else '0' for pixel in pixels)
-            return bits
-        
-        hash1 = compute_ahash(img1)
-        hash2 = compute_ahash(img2)
-        
-        if hash1 == hash2:
-            return 100.0
-        
-        differences = sum(c1 != c2 for c1, c2 in zip(hash1, hash2))
-        similarity = (1 - differences / len(hash1)) * 100
-        
-        return max(0, similarity)
-    except:
-        return 0
+def build_match(item, similarity, warehouse_stock=None, default_warehouse=None):
+    """Match result row with warehouse-wise stock"""
+    if warehouse_stock is None:
+        warehouse_stock = get_item_warehouses(item.item_code)
+    total_stock = sum(w.get('actual_qty', 0) for w in warehouse_stock)
+    
+    # Format warehouse details
+    warehouse_details = []
+    for wh in warehouse_stock:
+        warehouse_details.append({
+            "warehouse": wh.get('warehouse'),
+            "qty": wh.get('actual_qty', 0),
+            "reserved": wh.get('reserved_qty', 0),
+            "available": wh.get('actual_qty', 0) - wh.get('reserved_qty', 0)
+        })
+    
+    return {
+        "item_code": item.item_code,
+        "item_name": item.item_name,
+        "item_group": item.item_group or "",
+        "match_percentage": round(similarity, 1),
+        "stock_qty": total_stock,
+        "image": item.image,
+        "warehouse": default_warehouse or get_default_warehouse(),
+        "warehouse_stock": warehouse_details
+    }
 
 
-def histogram_similarity(img1, img2):
-    """Histogram comparison"""
-    try:
-        img1 = img1.resize((256, 256), Image.LANCZOS)
-        img2 = img2.resize((256, 256), Image.LANCZOS)
-        
-        h1_r = img1.split()[0].histogram()
-        h1_g = img1.split()[1].histogram()
-        h1_b = img1.split()[2].histogram()
-        
-        h2_r = img2.split()[0].histogram()
-        h2_g = img2.split()[1].histogram()
-        h2_b = img2.split()[2].histogram()
-        
-        def chi_square(h1, h2):
-            chi = 0
-            for i in range(len(h1)):
-                if h1[i] + h2[i] != 0:
-                    chi += ((h1[i] - h2[i]) ** 2) / (h1[i] + h2[i])
-            return chi
-        
-        chi_r = chi_square(h1_r, h2_r)
-        chi_g = chi_square(h1_g, h2_g)
-        chi_b = chi_square(h1_b, h2_b)
-        
-        avg_chi = (chi_r + chi_g + chi_b) / 3
-        similarity = max(0, 100 - (avg_chi / 500))
-        
-        return min(100, similarity)
-    except:
-        return 0
+def match_against_image_index(query, threshold=60, limit=MATCH_LIMIT, search_mode=None, scope=None,
+                              pending=None):
+    """
+    Score the uploaded image's ImageFingerprint against stored Item Image Fingerprints
+    scope: {field: value} filters, only fingerprints of matching items are scored
+    pending: fingerprint rows of photos not indexed yet (image_index.fingerprint_pending_images),
+    scored the same way and merged into the ranking
+    Returns None when the index is empty (caller falls back to full scan)
+    """
+    from shreerakhi_customizations.shree import image_search
+    
+    search_index = image_search.get_search_index()
+    if not len(search_index):
+        return None
+    
+    # Score the catalogue (or MIH candidates) in one pass
+    search_mode = image_search.get_search_mode(search_mode)
+    found = image_search.search(search_index, query.hashes, threshold, limit, search_mode=search_mode, scope=scope)
+    scored = [(search_index.items[row], score) for row, score in found["results"]]
+    
+    if pending:
+        pending_index = image_search.HashMatrixIndex(pending)
+        pending_found = image_search.search(pending_index, query.hashes, threshold, limit)
+        scored = image_search.merge_ranked(
+            scored + [(pending_index.items[row], score) for row, score in pending_found["results"]], limit
+        )
+        found["matched_count"] += pending_found["matched_count"]
+        found["candidate_count"] += pending_found["candidate_count"]
+    
+    stage_start = time.perf_counter()
+    matches = enrich_matches(scored)
+    found["timings"]["enrich_ms"] = round((time.perf_counter() - stage_start) * 1000, 3)
+    
+    return {
+        "success": True,
+        "matches": matches,
+        "scanned_count": found["candidate_count"],
+        "skipped_count": 0,
+        "matched_count": found["matched_count"],
+        "matching_method": "imagehash (indexed)",
+        "search_mode": search_mode,
+        "timings": found["timings"],
+        "imagehash_available": IMAGEHASH_AVAILABLE,
+        "scope": scope,
+        "index_size": search_index.item_count(search_index.scope_rows(scope))
+    }
+
+
+def get_local_image_path(url):
+    """Site file path of a local /files/ image URL"""
+    if "/files/" in url:
+        url = "/files/" + url.split("/files/")[-1]
+    return frappe.get_site_path("public", url.lstrip("/"))
 
 
-def thumbnail_similarity(img1, img2, size=(64, 64)):
-    """Thumbnail pixel comparison"""
+def load_image_from_url(url):
+    """
+    Load image from URL (local or external)
+    Returns the normalized thumbnail from the on-disk image cache
+    """
     try:
-        thumb1 = img1.resize(size, Image.LANCZOS)
-        thumb2 = img2.resize(size, Image.LANCZOS)
-        
-        pixels1 = list(thumb1.getdata())
-        pixels2 = list(thumb2.getdata())
-        
-        mse = 0
-        for p1, p2 in zip(pixels1, pixels2):
-            for c1, c2 in zip(p1, p2):
-                mse += (c1 - c2) ** 2
+        if not url:
+            return None
         
-        mse = mse / (len(pixels1) * 3)
-        similarity = max(0, 100 - (mse / 650))
+        return get_thumbnail(url)
         
-        return min(100, similarity)
-    except:
-        return 0
+    except Exception as e:
+        frappe.log_error(f"Image load error: {str(e)}")
+        return None
 
 
 def get_total_stock(item_code):
@@ -404,16 +318,24 @@ def get_total_stock(item_code):
 
 
 def get_default_warehouse():
-    """Get default warehouse"""
+    """Get default warehouse (cached for DEFAULT_WAREHOUSE_CACHE_TTL seconds)"""
+    cache = frappe.cache()
+    warehouse = cache.get_value(DEFAULT_WAREHOUSE_CACHE_KEY)
+    if warehouse:
+        return warehouse
+    
     try:
         warehouse = frappe.db.get_single_value("Stock Settings", "default_warehouse")
         if not warehouse:
             warehouses = frappe.get_all("Warehouse", limit=1)
             if warehouses:
                 warehouse = warehouses[0].name
-        return warehouse or "Main Warehouse"
+        warehouse = warehouse or "Main Warehouse"
     except:
         return "Main Warehouse"
+    
+    cache.set_value(DEFAULT_WAREHOUSE_CACHE_KEY, warehouse, expires_in_sec=DEFAULT_WAREHOUSE_CACHE_TTL)
+    return warehouse
 
 
 def get_item_warehouses(item_code):
@@ -434,9 +356,37 @@ def get_item_warehouses(item_code):
         return []
 
 
+def get_items_warehouses(item_codes):
+    """Warehouse-wise stock for many items in one query: {item_code: [bin rows]}"""
+    stock_by_item = {}
+    if not item_codes:
+        return stock_by_item
+    
+    try:
+        bins = frappe.db.sql("""
+            SELECT 
+                item_code,
+                warehouse,
+                actual_qty,
+                reserved_qty,
+                projected_qty
+            FROM `tabBin`
+            WHERE item_code IN %(item_codes)s AND actual_qty > 0
+            ORDER BY actual_qty DESC
+        """, {"item_codes": tuple(set(item_codes))}, as_dict=1)
+    except:
+        return stock_by_item
+    
+    for row in bins:
+        stock_by_item.setdefault(row.pop("item_code"), []).append(row)
+    return stock_by_item
+
+
 @frappe.whitelist()
 def test_single_match(uploaded_url, item_code):
     """Test matching with debug info"""
+    from shreerakhi_customizations.shree.image_search import get_color_weight
+    
     try:
         item = frappe.get_doc("Item", item_code)
         
@@ -449,13 +399,16 @@ def test_single_match(uploaded_url, item_code):
         if not uploaded_img or not item_img:
             return {"success": False, "message": "Failed to load images"}
         
-        # Calculate using both methods
+        # Fingerprint each image once, then compare with both methods
+        query = ImageFingerprint.from_image(uploaded_img, with_pil=True)
+        item_fingerprint = ImageFingerprint.from_image(item_img, with_pil=True)
+        
         if IMAGEHASH_AVAILABLE:
-            imagehash_similarity = calculate_imagehash_similarity(uploaded_img, item_img)
+            imagehash_similarity = query.imagehash_similarity(item_fingerprint, get_color_weight())
         else:
             imagehash_similarity = None
         
-        pil_similarity = calculate_pil_similarity(uploaded_img, item_img)
+        pil_similarity = query.pil_similarity(item_fingerprint)
         
         return {
             "success": True,
@@ -473,9 +426,15 @@ def test_single_match(uploaded_url, item_code):
 
 @frappe.whitelist()
 def check_matching_status():
-    """Check which matching method is available"""
+    """
+    Check which matching method is available
+    With measured scan telemetry (rolling window) and the fingerprint index size/version
+    """
+    from shreerakhi_customizations.shree.image_index import FINGERPRINT_DOCTYPE, get_index_version
+    from shreerakhi_customizations.shree.image_telemetry import get_scan_telemetry
+    from shreerakhi_customizations.shree.image_upload import get_upload_max_edge
     
-    # Count items with images for performance estimate
+    # Count items with images
     items_with_images = frappe.db.sql("""
         SELECT COUNT(*) as count
         FROM `tabItem`
@@ -485,11 +444,18 @@ def check_matching_status():
             AND (image LIKE 'http%%' OR image LIKE '/files/%%')
     """, as_dict=1)[0].count
     
+    telemetry = get_scan_telemetry()
+    average_ms = telemetry["avg_ms"].get("total")
+    
     return {
         "imagehash_available": IMAGEHASH_AVAILABLE,
         "pil_available": True,
         "active_method": "imagehash (Best)" if IMAGEHASH_AVAILABLE else "PIL-only (Good)",
         "recommendation": "Install imagehash for better accuracy: pip3 install imagehash" if not IMAGEHASH_AVAILABLE else "Using best available method",
         "items_with_images": items_with_images,
-        "estimated_scan_time": f"{items_with_images * 0.5:.1f} seconds" if items_with_images else "N/A"
+        "index_size": frappe.db.count(FINGERPRINT_DOCTYPE),
+        "index_version": get_index_version(),
+        "telemetry": telemetry,
+        "upload_max_edge": get_upload_max_edge(),
+        "estimated_scan_time": f"{average_ms / 1000:.1f} seconds (measured)" if average_ms is not None else "N/A"
     }
\ No newline at end of file
@@ -83,8 +83,13 @@ frappe.ui.form.on('Invoice PDF Upload', {
                 __('Extraction failed. Check error log below.'), 
                 'red'
             );
+        } else if (IN_PROGRESS_STATUSES.includes(frm.doc.invoice_status)) {
+            show_processing_status(frm, frm.doc.invoice_status);
         }
         
+        // Background pipeline steps, published by the processing job
+        listen_for_status(frm);
+        
         // Show selected series info
         if (frm.doc.invoice_series) {
             update_series_info(frm);
@@ -114,6 +119,46 @@ frappe.ui.form.on('Invoice PDF Upload', {
     }
 });
 
+const IN_PROGRESS_STATUSES = ['Queued', 'Extracting', 'Creating'];
+
+function show_processing_status(frm, status) {
+    let messages = {
+        'Queued': __('Queued for processing in the background...'),
+        'Extracting': __('Extracting data from PDF...'),
+        'Creating': __('Creating Sales Invoice...')
+    };
+    frm.dashboard.set_headline_alert(messages[status] || status, 'blue');
+}
+
+function listen_for_status(frm) {
+    if (frm.status_handler) {
+        frappe.realtime.off('invoice_pdf_status', frm.status_handler);
+    }
+    
+    frm.status_handler = function(data) {
+        if (data.name !== frm.doc.name) {
+            return;
+        }
+        
+        if (IN_PROGRESS_STATUSES.includes(data.invoice_status)) {
+            show_processing_status(frm, data.invoice_status);
+            return;
+        }
+        
+        // Processed or Failed - show the saved result
+        frappe.show_alert({
+            message: data.invoice_status === 'Processed'
+                ? __('Sales Invoice {0} created', [data.sales_invoice])
+                : __('Invoice PDF processing failed'),
+            indicator: data.invoice_status === 'Processed' ? 'green' : 'red'
+        }, 5);
+        if (!frm.is_dirty()) {
+            frm.reload_doc();
+        }
+    };
+    frappe.realtime.on('invoice_pdf_status', frm.status_handler);
+}
+
 // Load available invoice series from Sales Invoice naming series
 function load_invoice_series(frm) {
     // Get naming series from Sales Invoice DocType
@@ -318,7 +363,9 @@ function show_extraction_preview(frm, data) {
             frm.save().then(() => {
                 d.hide();
                 frappe.show_alert({
-                    message: __('✅ Invoice creation started with auto-numbering...'),
+                    message: frm.doc.process_in_background
+                        ? __('✅ Invoice creation queued, status updates will follow...')
+                        : __('✅ Invoice creation started with auto-numbering...'),
                     indicator: 'blue'
                 }, 3);
             });
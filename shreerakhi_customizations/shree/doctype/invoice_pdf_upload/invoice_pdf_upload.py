@@ -9,6 +9,10 @@ import base64
 from frappe.utils import get_files_path
 import os
 
+# Background processing: realtime event and job timeout
+STATUS_EVENT = "invoice_pdf_status"
+JOB_TIMEOUT = 10 * 60
+
 class InvoicePDFUpload(Document):
     def validate(self):
         # Validate PDF is present for new documents or if not yet processed
@@ -22,7 +26,105 @@ class InvoicePDFUpload(Document):
         
         # Only process if PDF exists and invoice not yet created
         if self.pdf_file and not self.sales_invoice and self.auto_create_invoice:
-            self.extract_and_create_invoice()
+            if self.process_in_background:
+                self.queue_processing()
+            else:
+                self.extract_and_create_invoice()
+    
+    def get_job_id(self):
+        return f"invoice_pdf_upload::{self.name}"
+    
+    def queue_processing(self):
+        """Save only marks the document Queued, the job is enqueued in on_update"""
+        from frappe.utils.background_jobs import is_job_enqueued
+        
+        # A job still waiting/running for this document is not queued twice
+        if not self.is_new() and is_job_enqueued(self.get_job_id()):
+            return
+        
+        self.invoice_status = "Queued"
+        self.error_log = None
+        self.flags.enqueue_processing = True
+    
+    def enqueue_processing(self):
+        frappe.enqueue(
+            "shreerakhi_customizations.shree.doctype.invoice_pdf_upload.invoice_pdf_upload.process_invoice_pdf",
+            queue="long",
+            timeout=JOB_TIMEOUT,
+            job_id=self.get_job_id(),
+            deduplicate=True,
+            enqueue_after_commit=True,
+            name=self.name,
+        )
+        # "Queued" is only visible to others once the save commits
+        self.publish_status(after_commit=True)
+    
+    def set_processing_status(self, status, error=None):
+        """Persist a pipeline step right away so the form and other workers see it"""
+        values = {"invoice_status": status}
+        if error is not None:
+            values["error_log"] = error
+        self.db_set(values, notify=True)
+        frappe.db.commit()
+        self.publish_status()
+    
+    def publish_status(self, after_commit=False):
+        frappe.publish_realtime(
+            STATUS_EVENT,
+            {
+                "name": self.name,
+                "invoice_status": self.invoice_status,
+                "sales_invoice": self.sales_invoice,
+                "error_log": self.error_log,
+            },
+            doctype=self.doctype,
+            docname=self.name,
+            after_commit=after_commit,
+        )
+    
+    def process_queued(self):
+        """
+        Background pipeline: Extracting -> Creating -> Processed, or Failed
+        Every step is committed on its own, so no transaction stays open
+        during the extraction API call
+        """
+        self.set_processing_status("Extracting")
+        try:
+            file_doc = frappe.get_doc("File", {"file_url": self.pdf_file})
+            extracted_data = self.extract_pdf_using_api(file_doc)
+        except Exception as e:
+            frappe.db.rollback()
+            frappe.log_error(f"Error in PDF extraction: {str(e)}", "Invoice PDF Upload Error")
+            self.set_processing_status("Failed", str(e))
+            return
+        
+        self.db_set({
+            "extracted_data": json.dumps(extracted_data, indent=2),
+            "detected_invoice_type": (
+                "Bill of Supply" if extracted_data.get("invoice_type") == "bill_of_supply" else "Normal Invoice"
+            ),
+        })
+        
+        if not extracted_data.get("customer_name"):
+            self.set_processing_status("Failed", "Could not extract sufficient data from PDF")
+            return
+        
+        self.set_processing_status("Creating")
+        try:
+            invoice = self.create_sales_invoice(extracted_data)
+            self.sales_invoice = invoice.name
+            self.invoice_status = "Processed"
+            # on_update deletes the PDF when configured
+            self.save(ignore_permissions=True)
+            frappe.db.commit()
+        except Exception as e:
+            frappe.db.rollback()
+            frappe.log_error(f"Error creating invoice from PDF: {str(e)}", "Invoice PDF Upload Error")
+            self.reload()
+            self.set_processing_status("Failed", str(e))
+            return
+        
+        self.publish_status()
     
     def extract_and_create_invoice(self):
         """PDF se data extract karke Sales Invoice create karta hai"""
@@ -68,6 +170,10 @@ class InvoicePDFUpload(Document):
     
     def on_update(self):
         """Called after document is saved - safe to delete PDF here"""
+        if self.flags.enqueue_processing:
+            self.flags.enqueue_processing = False
+            self.enqueue_processing()
+        
         # Only delete if processing was successful and option is enabled
         if (self.invoice_status == "Processed" and 
             self.delete_pdf_after_processing and 
@@ -587,6 +693,17 @@ class InvoicePDFUpload(Document):
         }
 
 
+def process_invoice_pdf(name):
+    """Background job queued on save of an Invoice PDF Upload"""
+    doc = frappe.get_doc("Invoice PDF Upload", name)
+    
+    # Processed meanwhile, or the PDF was replaced/removed
+    if doc.sales_invoice or not doc.pdf_file or doc.invoice_status != "Queued":
+        return
+    
+    doc.process_queued()
+
+
 @frappe.whitelist()
 def debug_invoice_discount(invoice_name):
     """Debug discount values"""
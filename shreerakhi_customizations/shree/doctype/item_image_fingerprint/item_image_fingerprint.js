@@ -0,0 +1,8 @@
+// Copyright (c) 2026, atul and contributors
+// For license information, please see license.txt
+
+// frappe.ui.form.on("Item Image Fingerprint", {
+// 	refresh(frm) {
+
+// 	},
+// });
@@ -17,6 +17,9 @@ frappe.ui.form.on('Item Image Scanner', {
         
         // Check matching status
         check_matching_status(frm);
+        
+        // Image index maintenance
+        add_rebuild_index_button(frm);
     },
     
     scan_image: function(frm) {
@@ -30,17 +33,24 @@ frappe.ui.form.on('Item Image Scanner', {
 });
 
 function scan_and_match_items(frm) {
-    frappe.show_progress(__('Scanning'), 30, 100, __('Matching items...'));
+    frappe.show_progress(__('Scanning'), 0, 100, __('Matching items...'));
+    
+    // Partial matches are streamed over realtime while the scan runs
+    let scan_id = frappe.utils.get_random(10);
+    listen_for_scan_progress(frm, scan_id);
     
     // CORRECT API call path
     frappe.call({
         method: 'shreerakhi_customizations.shree.api.match_item_by_image',
         args: {
-            image_url: frm.doc.scan_image
+            image_url: frm.doc.scan_image,
+            scan_id: scan_id,
+            item_group: frm.doc.item_group,
+            custom_item_range: frm.doc.custom_item_range,
+            custom_item_category: frm.doc.custom_item_category
         },
-        freeze: true,
-        freeze_message: __('Scanning image...'),
         callback: function(r) {
+            stop_scan_progress(frm);
             frappe.hide_progress();
             
             console.log('API Response:', r); // Debug log
@@ -65,6 +75,14 @@ function scan_and_match_items(frm) {
                     message: __(`Found ${matches.length} matches - ${stats}`),
                     indicator: 'green'
                 }, 8);
+                
+                // Photos the background index job has not reached yet, or could not read, were not compared
+                if (r.message.unindexed_count) {
+                    frappe.show_alert({
+                        message: __('{0} item photos are not indexed yet and were not compared', [r.message.unindexed_count]),
+                        indicator: 'orange'
+                    }, 8);
+                }
             } else {
                 frappe.msgprint({
                     title: __('No Matches Found'),
@@ -74,6 +92,7 @@ function scan_and_match_items(frm) {
             }
         },
         error: function(err) {
+            stop_scan_progress(frm);
             frappe.hide_progress();
             console.error('Scan error:', err);
             
@@ -94,6 +113,38 @@ function scan_and_match_items(frm) {
     });
 }
 
+function listen_for_scan_progress(frm, scan_id) {
+    stop_scan_progress(frm);
+    
+    frm.scan_progress_handler = function(data) {
+        // Ignore updates of an earlier scan, and anything after the final response
+        if (data.scan_id !== scan_id || frm.scan_progress_handler === null) {
+            return;
+        }
+        
+        if (data.matches && data.matches.length) {
+            display_results(frm, data.matches);
+        }
+        
+        if (!data.done) {
+            frappe.show_progress(
+                __('Scanning'),
+                data.processed,
+                data.total,
+                __('{0} of {1} items checked', [data.processed, data.total])
+            );
+        }
+    };
+    frappe.realtime.on('image_scan_progress', frm.scan_progress_handler);
+}
+
+function stop_scan_progress(frm) {
+    if (frm.scan_progress_handler) {
+        frappe.realtime.off('image_scan_progress', frm.scan_progress_handler);
+    }
+    frm.scan_progress_handler = null;
+}
+
 function display_results(frm, matches) {
     if (!matches || matches.length === 0) {
         frm.fields_dict.matching_results.$wrapper.html(
@@ -221,6 +272,59 @@ function add_camera_button(frm) {
     });
     
     frm.fields_dict.scan_image.$wrapper.append($btn);
+    
+    // Gallery photo, resized in the browser before upload
+    let $file_input = $('<input type="file" accept="image/*" style="display: none;">');
+    let $choose_btn = $(`
+        <button class="btn btn-sm btn-default choose-photo-btn" style="margin-top: 8px; margin-left: 5px;">
+            <i class="fa fa-picture-o"></i> Choose Photo
+        </button>
+    `);
+    $choose_btn.on('click', function(e) {
+        e.preventDefault();
+        $file_input.val('').trigger('click');
+    });
+    $file_input.on('change', function() {
+        let file = this.files && this.files[0];
+        if (!file) {
+            return;
+        }
+        resize_image_file(file, get_upload_max_edge(frm), function(blob) {
+            upload_image_file(frm, blob);
+        });
+    });
+    
+    frm.fields_dict.scan_image.$wrapper.append($choose_btn).append($file_input);
+}
+
+function get_upload_max_edge(frm) {
+    // Site config image_scan_upload_max_edge, sent with the matching status
+    return frm.upload_max_edge || 1024;
+}
+
+function resize_to_blob(source, width, height, max_edge, callback) {
+    // Draw onto a canvas no larger than max_edge and re-encode as JPEG
+    let scale = Math.min(1, max_edge / Math.max(width, height));
+    let canvas = document.createElement('canvas');
+    canvas.width = Math.round(width * scale);
+    canvas.height = Math.round(height * scale);
+    canvas.getContext('2d').drawImage(source, 0, 0, canvas.width, canvas.height);
+    canvas.toBlob(callback, 'image/jpeg', 0.85);
+}
+
+function resize_image_file(file, max_edge, callback) {
+    let url = URL.createObjectURL(file);
+    let img = new Image();
+    img.onload = function() {
+        URL.revokeObjectURL(url);
+        resize_to_blob(img, img.naturalWidth, img.naturalHeight, max_edge, callback);
+    };
+    img.onerror = function() {
+        // Not decodable here - upload the original file, the server normalizes it
+        URL.revokeObjectURL(url);
+        callback(file);
+    };
+    img.src = url;
 }
 
 function check_matching_status(frm) {
@@ -229,12 +333,16 @@ function check_matching_status(frm) {
         method: 'shreerakhi_customizations.shree.api.check_matching_status',
         callback: function(r) {
             if (r.message) {
+                frm.upload_max_edge = r.message.upload_max_edge;
+                
                 let status_html = `
                     <div style="margin-top: 10px; padding: 8px; background: #f8f9fa; border-radius: 4px; font-size: 11px;">
                         <strong>Matching Engine:</strong> ${r.message.active_method}
                         ${!r.message.imagehash_available ? 
                             '<br><span style="color: #856404;">💡 Tip: Install imagehash for better accuracy</span>' : 
                             '<br><span style="color: #155724;">✓ Using best available method</span>'}
+                        <br><strong>Index:</strong> ${r.message.index_size} fingerprints (version ${r.message.index_version})
+                        ${get_telemetry_html(r.message.telemetry)}
                     </div>
                 `;
                 
@@ -249,6 +357,70 @@ function check_matching_status(frm) {
     });
 }
 
+function get_telemetry_html(telemetry) {
+    // Rolling scan aggregates measured by the matcher
+    if (!telemetry || !telemetry.scans) {
+        return '<br><span class="text-muted">No scans measured yet</span>';
+    }
+    
+    let avg = telemetry.avg_ms || {};
+    let stages = ['load', 'hash', 'index', 'compare', 'enrich']
+        .filter(stage => avg[stage] !== undefined)
+        .map(stage => `${stage} ${avg[stage]}`)
+        .join(' / ');
+    
+    return `
+        <br><strong>Last ${telemetry.window_hours}h:</strong>
+        ${telemetry.scans} scans (${telemetry.scans_per_hour}/h),
+        cache hits ${telemetry.cache_hit_rate}%, failed ${telemetry.failed}, skipped ${telemetry.skipped}
+        <br><strong>Scan time:</strong> avg ${avg.total} ms, p50 ≤ ${telemetry.p50_ms} ms, p95 ≤ ${telemetry.p95_ms} ms
+        ${stages ? `<br><span class="text-muted">Stages (ms): ${stages}</span>` : ''}
+    `;
+}
+
+function add_rebuild_index_button(frm) {
+    if (!frappe.user.has_role('System Manager') && !frappe.user.has_role('Stock Manager')) {
+        return;
+    }
+    
+    frm.add_custom_button(__('Rebuild Image Index'), function() {
+        frappe.confirm(__('Re-index all item images in the background?'), function() {
+            frappe.call({
+                method: 'shreerakhi_customizations.shree.image_index.rebuild_image_index',
+                callback: function(r) {
+                    if (r.message) {
+                        frappe.show_alert({
+                            message: __(r.message.message),
+                            indicator: r.message.success ? 'blue' : 'orange'
+                        }, 5);
+                    }
+                }
+            });
+        });
+    });
+    
+    // Progress published by the background rebuild job
+    frappe.realtime.off('image_index_progress');
+    frappe.realtime.on('image_index_progress', function(data) {
+        if (data.done) {
+            frappe.hide_progress();
+            frappe.show_alert({
+                message: __('Image index rebuilt - Updated: {0}, Unchanged: {1}, Failed: {2}',
+                    [data.stats.updated, data.stats.unchanged, data.stats.failed]),
+                indicator: 'green'
+            }, 8);
+            return;
+        }
+        
+        frappe.show_progress(
+            __('Rebuilding Image Index'),
+            data.processed,
+            data.total,
+            __('{0} of {1} items', [data.processed, data.total])
+        );
+    });
+}
+
 function open_camera_dialog(frm) {
     let d = new frappe.ui.Dialog({
         title: __('Take Photo'),
@@ -262,7 +434,6 @@ function open_camera_dialog(frm) {
                         <video id="video-stream" autoplay playsinline 
                                style="max-width: 100%; max-height: 400px; border: 2px solid #ddd; border-radius: 8px;">
                         </video>
-                        <canvas id="photo-canvas" style="display: none;"></canvas>
                         <div style="margin-top: 15px;">
                             <button class="btn btn-primary btn-lg" id="capture-photo">
                                 <i class="fa fa-camera"></i> Capture
@@ -289,7 +460,6 @@ function open_camera_dialog(frm) {
     
     setTimeout(function() {
         video = document.getElementById('video-stream');
-        let canvas = document.getElementById('photo-canvas');
         let captureBtn = document.getElementById('capture-photo');
         let switchBtn = document.getElementById('switch-camera');
         
@@ -322,11 +492,8 @@ function open_camera_dialog(frm) {
         
         // Capture photo
         captureBtn.onclick = function() {
-            canvas.width = video.videoWidth;
-            canvas.height = video.videoHeight;
-            canvas.getContext('2d').drawImage(video, 0, 0);
-            
-            canvas.toBlob(function(blob) {
+            // Full camera resolution is never uploaded
+            resize_to_blob(video, video.videoWidth, video.videoHeight, get_upload_max_edge(frm), function(blob) {
                 // Stop camera
                 if (stream) {
                     stream.getTracks().forEach(track => track.stop());
@@ -335,7 +502,7 @@ function open_camera_dialog(frm) {
                 // Upload file
                 upload_image_file(frm, blob);
                 d.hide();
-            }, 'image/jpeg', 0.9);
+            });
         };
         
         // Cleanup on dialog close
@@ -349,8 +516,9 @@ function open_camera_dialog(frm) {
 }
 
 function upload_image_file(frm, blob) {
-    let filename = 'scan_' + Date.now() + '.jpg';
-    let file = new File([blob], filename, { type: 'image/jpeg' });
+    // Canvas output is JPEG; an original file keeps its own name and type
+    let file = blob instanceof File ? blob : new File([blob], 'scan_' + Date.now() + '.jpg', { type: 'image/jpeg' });
+    let filename = file.name;
     
     frappe.show_progress(__('Uploading'), 50, 100);
     
@@ -363,7 +531,10 @@ function upload_image_file(frm, blob) {
                 filename: filename,
                 filedata: e.target.result,
                 is_private: 0,
-                folder: 'Home/Attachments'
+                folder: 'Home/Attachments',
+                doctype: frm.doctype,
+                docname: frm.docname,
+                fieldname: 'scan_image'
             },
             callback: function(r) {
                 frappe.hide_progress();
@@ -0,0 +1,250 @@
+"""
+Multi-photo Batch Matching
+Match a tray of photos (image URLs or an uploaded zip) against the fingerprint
+index in one pass: all query fingerprints hashed together, scored as one
+query-by-item matrix, per-photo top-K returned
+Path: shreerakhi_customizations/shree/image_batch.py
+"""
+
+import os
+import time
+from zipfile import BadZipFile, ZipFile
+
+import frappe
+
+from shreerakhi_customizations.shree.api import (
+    IMAGEHASH_AVAILABLE,
+    build_match,
+    get_default_warehouse,
+    get_items_warehouses,
+)
+from shreerakhi_customizations.shree.image_hashing import fingerprint_image_source
+from shreerakhi_customizations.shree.image_workers import map_isolated
+
+BATCH_PROGRESS_EVENT = "image_batch_progress"
+BATCH_PROGRESS_INTERVAL = 0.5
+DEFAULT_MAX_PHOTOS = 100
+DEFAULT_BATCH_LIMIT = 5
+DEFAULT_BATCH_THRESHOLD = 60
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp", ".gif")
+# Zip members larger than this are skipped (a phone photo is a few MB)
+MAX_ZIP_MEMBER_BYTES = 25 * 1024 * 1024
+
+
+class BatchProgress:
+    """Throttled image_batch_progress realtime updates, only with a batch_id"""
+
+    def __init__(self, batch_id, total):
+        self.batch_id = batch_id
+        self.total = total
+        self.last_published = 0
+
+    def publish(self, processed, stage, force=False):
+        if not self.batch_id:
+            return
+        if not force and time.monotonic() - self.last_published < BATCH_PROGRESS_INTERVAL:
+            return
+        self.last_published = time.monotonic()
+        frappe.publish_realtime(
+            BATCH_PROGRESS_EVENT,
+            {
+                "batch_id": self.batch_id,
+                "processed": processed,
+                "total": self.total,
+                "stage": stage,
+            },
+            user=frappe.session.user
+        )
+
+
+@frappe.whitelist()
+def match_images_batch(image_urls=None, zip_url=None, limit=DEFAULT_BATCH_LIMIT,
+                       threshold=DEFAULT_BATCH_THRESHOLD, batch_id=None):
+    """
+    Top matches for every photo of a batch
+    image_urls: list (or JSON list) of uploaded /files/ image URLs
+    zip_url: file URL of an uploaded zip of photos
+    batch_id: publish progress on the image_batch_progress realtime event
+    """
+    from shreerakhi_customizations.shree import image_search
+    from shreerakhi_customizations.shree.image_index import (
+        fingerprint_pending_images,
+        get_unindexed_images,
+        queue_unindexed_images,
+    )
+
+    if not IMAGEHASH_AVAILABLE:
+        return {"success": False, "message": "Batch matching needs the imagehash library"}
+
+    limit = max(1, frappe.utils.cint(limit))
+    threshold = frappe.utils.flt(threshold)
+
+    max_photos = int(frappe.conf.get("image_batch_max_photos") or DEFAULT_MAX_PHOTOS)
+    photos = get_batch_photos(image_urls, zip_url, max_photos)
+    if not photos:
+        return {"success": False, "message": "No images found in the batch"}
+
+    timings = {}
+    progress = BatchProgress(batch_id, len(photos))
+    progress.publish(0, "indexing", force=True)
+
+    # Photos not fingerprinted yet are indexed by a background job, the batch
+    # is matched against the current index plus a few of them fingerprinted here
+    stage_start = time.perf_counter()
+    unindexed = get_unindexed_images()
+    index_queued = bool(unindexed) and queue_unindexed_images(unindexed)
+    search_index = image_search.get_search_index()
+    if not len(search_index):
+        return {"success": False, "message": "The image index is still being built, try again in a few minutes"}
+
+    pending = fingerprint_pending_images(unindexed)
+    pending_index = image_search.HashMatrixIndex(pending) if pending else None
+    timings["index_ms"] = round((time.perf_counter() - stage_start) * 1000, 3)
+
+    # Fingerprint the photos in this worker - no process pool per web request,
+    # image_batch_max_photos bounds the work
+    stage_start = time.perf_counter()
+    results = []
+    fingerprints = []
+    loaded = [(label, source) for label, source in photos if source is not None]
+    for label, source in photos:
+        if source is None:
+            results.append({"image": label, "success": False, "message": "Failed to load image"})
+
+    fingerprinted = map_isolated(fingerprint_image_source, [source for _, source in loaded])
+    for done, ((label, _), (fingerprint, error)) in enumerate(zip(loaded, fingerprinted, strict=True), 1):
+        if error:
+            results.append({"image": label, "success": False, "message": error})
+        else:
+            fingerprints.append((label, fingerprint))
+        progress.publish(done, "fingerprinting")
+    timings["fingerprint_ms"] = round((time.perf_counter() - stage_start) * 1000, 3)
+
+    # Score every photo against every item as one matrix
+    stage_start = time.perf_counter()
+    progress.publish(len(photos), "matching", force=True)
+    queries = image_search.HashMatrixIndex([fingerprint for _, fingerprint in fingerprints])
+    ranked, matched_counts = score_batch(search_index, queries, limit, threshold)
+    if pending_index:
+        pending_ranked, pending_counts = score_batch(pending_index, queries, limit, threshold)
+        ranked = [
+            image_search.merge_ranked(scored + pending_scored, limit)
+            for scored, pending_scored in zip(ranked, pending_ranked, strict=True)
+        ]
+        matched_counts = [count + extra for count, extra in zip(matched_counts, pending_counts, strict=True)]
+    timings["match_ms"] = round((time.perf_counter() - stage_start) * 1000, 3)
+
+    # Stock for all matched items of the batch in one query
+    stage_start = time.perf_counter()
+    matched_codes = {item.item_code for scored in ranked for item, _ in scored}
+    stock_by_item = get_items_warehouses(list(matched_codes))
+    default_warehouse = get_default_warehouse()
+
+    for (label, _), scored, matched_count in zip(fingerprints, ranked, matched_counts, strict=True):
+        results.append({
+            "image": label,
+            "success": True,
+            "matches": [
+                build_match(item, score, stock_by_item.get(item.item_code, []), default_warehouse)
+                for item, score in scored
+            ],
+            "matched_count": matched_count,
+        })
+    timings["enrich_ms"] = round((time.perf_counter() - stage_start) * 1000, 3)
+
+    # Same order as the request
+    order = {label: idx for idx, (label, _) in enumerate(photos)}
+    results.sort(key=lambda result: order[result["image"]])
+
+    progress.publish(len(photos), "done", force=True)
+
+    return {
+        "success": True,
+        "results": results,
+        "photo_count": len(photos),
+        "index_size": len(search_index),
+        "pending_count": len(pending),
+        "unindexed_count": len(unindexed) - len(pending),
+        "index_queued": index_queued,
+        "matching_method": "imagehash (batch)",
+        "timings": timings,
+    }
+
+
+def score_batch(search_index, queries, limit, threshold):
+    """
+    Every query photo against every item of search_index as one matrix
+    Returns per photo the [(item, score)] top matches and the count above threshold
+    """
+    from shreerakhi_customizations.shree import image_search
+
+    scores = search_index.best_per_item(search_index.batch_scores(queries, image_search.get_color_weight()))
+    top_rows = image_search.top_k_rows(scores, limit, threshold)
+
+    ranked = [
+        [(search_index.items[row], float(photo_scores[row])) for row in rows]
+        for photo_scores, rows in zip(scores, top_rows, strict=True)
+    ]
+    return ranked, [int((photo_scores >= threshold).sum()) for photo_scores in scores]
+
+
+def get_batch_photos(image_urls=None, zip_url=None, max_photos=DEFAULT_MAX_PHOTOS):
+    """
+    [(label, source)] for the hashing workers, source is a local path, bytes,
+    or None if the image could not be loaded
+    The photo count is checked against max_photos before any photo is read
+    """
+    from shreerakhi_customizations.shree.image_index import get_image_sources
+
+    if isinstance(image_urls, str):
+        image_urls = frappe.parse_json(image_urls)
+    image_urls = list(dict.fromkeys(url for url in image_urls or [] if url))
+
+    # Only this site's uploads - the server never fetches a caller-supplied URL
+    for url in image_urls:
+        if not is_local_upload(url):
+            frappe.throw(f"Only uploaded /files/ images can be batch matched, got {url}")
+
+    archive = open_zip(zip_url) if zip_url else None
+    try:
+        members = get_zip_photo_members(archive) if archive else []
+        total = len(image_urls) + len(members)
+        if total > max_photos:
+            frappe.throw(f"A batch can have at most {max_photos} photos, got {total}")
+
+        photos = list(zip(image_urls, get_image_sources(image_urls), strict=True))
+        for info in members:
+            label = f"{zip_url}:{info.filename}"
+            # Oversized members are reported as failed, never read
+            photos.append((label, None if info.file_size > MAX_ZIP_MEMBER_BYTES else archive.read(info)))
+    finally:
+        if archive:
+            archive.close()
+
+    return photos
+
+
+def is_local_upload(url):
+    return url.startswith("/files/") and ".." not in url
+
+
+def open_zip(zip_url):
+    """Uploaded zip read from disk (members are only read on demand)"""
+    file_doc = frappe.get_doc("File", {"file_url": zip_url})
+    file_doc.check_permission("read")
+    try:
+        return ZipFile(file_doc.get_full_path())
+    except BadZipFile:
+        frappe.throw(f"{zip_url} is not a valid zip file")
+
+
+def get_zip_photo_members(archive):
+    """Image members of a zip, from its directory only"""
+    return [
+        info for info in archive.infolist()
+        if not info.is_dir()
+        and not info.filename.startswith("__MACOSX/")
+        and not os.path.basename(info.filename).startswith(".")
+        and info.filename.lower().endswith(IMAGE_EXTENSIONS)
+    ]
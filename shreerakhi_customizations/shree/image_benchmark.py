@@ -0,0 +1,322 @@
+"""
+Image Matcher Benchmark
+Synthetic catalogue of N generated images, queried with perturbed copies
+(crop, rotation, lighting, JPEG quality). Measures latency, throughput and
+recall@K of the imagehash full scan, the PIL-only scorer and the indexed
+search modes at several catalogue sizes, and writes the results as JSON so
+runs can be compared across commits
+
+On a site:
+    bench --site <site> execute shreerakhi_customizations.shree.image_benchmark.run_benchmark
+Without a site (frappe calls go to a minimal in-process stand-in):
+    python -m shreerakhi_customizations.shree.image_benchmark --sizes 250 1000 --output bench.json
+Path: shreerakhi_customizations/shree/image_benchmark.py
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+import types
+from datetime import datetime
+from io import BytesIO
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageEnhance
+
+IMAGE_SIZE = 256
+PERTURBATIONS = ("crop", "rotate", "lighting", "jpeg")
+DEFAULT_SIZES = (250, 1000, 4000)
+DEFAULT_QUERIES = 40  # per perturbation
+DEFAULT_TOP_K = (1, 5, 10)
+DEFAULT_SEED = 7
+
+# Candidates scored per block by the PIL-only scorer (bounds the thumbnail diff temporaries)
+PIL_BLOCK_SIZE = 500
+
+
+# ============================================
+# SYNTHETIC CATALOGUE
+# ============================================
+def synthetic_image(index, seed=DEFAULT_SEED):
+    """Catalogue image number index: gradient background with random shapes, deterministic"""
+    rng = np.random.default_rng([seed, index])
+
+    start, end = rng.integers(0, 256, size=(2, 3))
+    ramp = np.linspace(0, 1, IMAGE_SIZE)[:, None, None]
+    background = (start + (end - start) * ramp).astype(np.uint8)
+    img = Image.fromarray(np.broadcast_to(background, (IMAGE_SIZE, IMAGE_SIZE, 3)).copy(), "RGB")
+
+    draw = ImageDraw.Draw(img)
+    for _ in range(int(rng.integers(4, 9))):
+        color = tuple(int(c) for c in rng.integers(0, 256, size=3))
+        x0, y0 = (int(v) for v in rng.integers(0, IMAGE_SIZE - 40, size=2))
+        x1, y1 = x0 + int(rng.integers(30, 140)), y0 + int(rng.integers(30, 140))
+        shape = rng.integers(3)
+        if shape == 0:
+            draw.ellipse((x0, y0, x1, y1), fill=color)
+        elif shape == 1:
+            draw.rectangle((x0, y0, x1, y1), fill=color)
+        else:
+            points = [tuple(int(v) for v in rng.integers(0, IMAGE_SIZE, size=2)) for _ in range(3)]
+            draw.polygon(points, fill=color)
+    return img
+
+
+def perturb(img, kind, rng):
+    """Query photo of a catalogue image: one controlled perturbation"""
+    if kind == "crop":
+        keep = rng.uniform(0.80, 0.92)
+        width, height = int(IMAGE_SIZE * keep), int(IMAGE_SIZE * keep)
+        left = int(rng.integers(0, IMAGE_SIZE - width + 1))
+        top = int(rng.integers(0, IMAGE_SIZE - height + 1))
+        return img.crop((left, top, left + width, top + height))
+    if kind == "rotate":
+        return img.rotate(rng.uniform(-12, 12), resample=Image.BICUBIC, fillcolor=(255, 255, 255))
+    if kind == "lighting":
+        img = ImageEnhance.Brightness(img).enhance(rng.uniform(0.7, 1.3))
+        return ImageEnhance.Contrast(img).enhance(rng.uniform(0.8, 1.2))
+    if kind == "jpeg":
+        buffer = BytesIO()
+        img.save(buffer, "JPEG", quality=int(rng.integers(15, 40)))
+        return Image.open(BytesIO(buffer.getvalue())).convert("RGB")
+    raise ValueError(f"Unknown perturbation: {kind}")
+
+
+def fingerprint(img, with_hashes):
+    """(ImageFingerprint with hashes and PIL features, hex hashes or None, hash ms, PIL ms)"""
+    from shreerakhi_customizations.shree.image_features import ImageFingerprint, extract_pil_features
+    from shreerakhi_customizations.shree.image_hashing import (
+        compute_image_hashes,
+        normalize_image,
+        pack_hashes,
+    )
+
+    img = normalize_image(img)
+
+    start = time.perf_counter()
+    hex_hashes = compute_image_hashes(img) if with_hashes else None
+    hashed = time.perf_counter()
+    pil_features = extract_pil_features(img)
+    done = time.perf_counter()
+
+    return (
+        ImageFingerprint(hashes=pack_hashes(hex_hashes) if hex_hashes else None, pil_features=pil_features),
+        hex_hashes,
+        (hashed - start) * 1000,
+        (done - hashed) * 1000,
+    )
+
+
+# ============================================
+# MATCHERS UNDER TEST
+# ============================================
+def imagehash_scan(query, catalogue, color_weight):
+    """Per-item imagehash scoring as in the full-scan strategy"""
+    return np.array([query.imagehash_similarity(item, color_weight) for item in catalogue])
+
+
+def pil_scan(query, stacked):
+    """PIL-only scores of every catalogue image"""
+    from shreerakhi_customizations.shree.image_features import pil_similarity_scores
+
+    size = len(stacked["dhash"])
+    return np.concatenate([
+        pil_similarity_scores(query.pil_features, {key: value[start:start + PIL_BLOCK_SIZE] for key, value in stacked.items()})
+        for start in range(0, size, PIL_BLOCK_SIZE)
+    ])
+
+
+def ranked(scores, k):
+    """Indices of the k best scores, best first"""
+    k = min(k, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind="stable")].tolist()
+
+
+def summarize(latencies, hits, kinds, top_k):
+    """Latency, throughput and recall@K (overall and per perturbation) of one mode"""
+    latencies = np.array(latencies)
+    summary = {
+        "queries": len(latencies),
+        "latency_ms_mean": round(float(latencies.mean()), 3),
+        "latency_ms_p50": round(float(np.percentile(latencies, 50)), 3),
+        "latency_ms_p95": round(float(np.percentile(latencies, 95)), 3),
+        "throughput_qps": round(len(latencies) / (latencies.sum() / 1000), 2) if latencies.sum() else None,
+    }
+    ranks = np.array(hits)
+    kinds = np.array(kinds)
+    for k in top_k:
+        summary[f"recall@{k}"] = round(float(((ranks >= 0) & (ranks < k)).mean()), 4)
+    summary["recall_by_perturbation"] = {
+        kind: {
+            f"recall@{k}": round(float(((ranks[kinds == kind] >= 0) & (ranks[kinds == kind] < k)).mean()), 4)
+            for k in top_k
+        }
+        for kind in PERTURBATIONS if (kinds == kind).any()
+    }
+    return summary
+
+
+# ============================================
+# HARNESS
+# ============================================
+def run_benchmark(sizes=DEFAULT_SIZES, queries=DEFAULT_QUERIES, top_k=DEFAULT_TOP_K,
+                  seed=DEFAULT_SEED, output=None, modes=None):
+    """
+    Benchmark every available matcher at each catalogue size
+    queries: query photos per perturbation, targets drawn from the smallest catalogue
+    modes: subset of imagehash_scan, pil_scan, indexed_<search mode>
+    output: JSON results path (default image_benchmark-<commit>-<time>.json)
+    """
+    from shreerakhi_customizations.shree import image_search
+    from shreerakhi_customizations.shree.image_features import stack_pil_features
+    from shreerakhi_customizations.shree.image_hashing import IMAGEHASH_AVAILABLE
+
+    sizes = sorted(int(size) for size in sizes)
+    top_k = sorted(int(k) for k in top_k)
+    color_weight = image_search.get_color_weight()
+
+    available = ["pil_scan"]
+    if IMAGEHASH_AVAILABLE:
+        available = ["imagehash_scan", "pil_scan", *(f"indexed_{mode}" for mode in image_search.SEARCH_MODES)]
+    modes = [mode for mode in (modes or available) if mode in available]
+
+    # Catalogue fingerprints, generated once for the largest size
+    catalogue, rows = [], []
+    hash_ms, pil_ms = [], []
+    for index in range(sizes[-1]):
+        item, hex_hashes, hashed_ms, features_ms = fingerprint(synthetic_image(index, seed), IMAGEHASH_AVAILABLE)
+        catalogue.append(item)
+        if hex_hashes:
+            rows.append({"name": f"ITEM-{index:06d}", **hex_hashes})
+        hash_ms.append(hashed_ms)
+        pil_ms.append(features_ms)
+
+    # Query photos: perturbed copies of items present in every catalogue size
+    rng = np.random.default_rng([seed, 1])
+    query_set = []
+    for kind in PERTURBATIONS:
+        for target in rng.integers(0, sizes[0], size=int(queries)):
+            query, *_ = fingerprint(perturb(synthetic_image(int(target), seed), kind, rng), IMAGEHASH_AVAILABLE)
+            query_set.append((kind, int(target), query))
+
+    results = []
+    for size in sizes:
+        search_index = image_search.HashMatrixIndex(rows[:size]) if IMAGEHASH_AVAILABLE else None
+        stacked = stack_pil_features([item.pil_features for item in catalogue[:size]])
+
+        for mode in modes:
+            latencies, hits, kinds = [], [], []
+            for kind, target, query in query_set:
+                start = time.perf_counter()
+                if mode == "imagehash_scan":
+                    found = ranked(imagehash_scan(query, catalogue[:size], color_weight), top_k[-1])
+                elif mode == "pil_scan":
+                    found = ranked(pil_scan(query, stacked), top_k[-1])
+                else:
+                    search_mode = mode.split("_", 1)[1]
+                    found = image_search.search(search_index, query.hashes, 0, top_k[-1], search_mode=search_mode)
+                    found = [idx for idx, _ in found["results"]]
+                latencies.append((time.perf_counter() - start) * 1000)
+                hits.append(found.index(target) if target in found else -1)
+                kinds.append(kind)
+
+            results.append({"catalogue_size": size, "mode": mode, **summarize(latencies, hits, kinds, top_k)})
+            print(f"{size:>7} {mode:<17} p50 {results[-1]['latency_ms_p50']:>9.3f} ms  "
+                  f"recall@{top_k[0]} {results[-1][f'recall@{top_k[0]}']:.3f}", file=sys.stderr)
+
+    report = {
+        "meta": {
+            "commit": get_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "imagehash_available": IMAGEHASH_AVAILABLE,
+            "color_weight": color_weight,
+            "seed": seed,
+            "sizes": sizes,
+            "queries_per_perturbation": int(queries),
+            "top_k": top_k,
+        },
+        "catalogue": {
+            "images": sizes[-1],
+            "hash_ms_per_image": round(float(np.mean(hash_ms)), 3) if IMAGEHASH_AVAILABLE else None,
+            "pil_features_ms_per_image": round(float(np.mean(pil_ms)), 3),
+        },
+        "results": results,
+    }
+
+    output = output or f"image_benchmark-{report['meta']['commit'] or 'local'}-{datetime.now():%Y%m%d%H%M%S}.json"
+    with open(output, "w") as f:
+        json.dump(report, f, indent=1)
+    print(f"Results written to {output}", file=sys.stderr)
+    return report
+
+
+def get_commit():
+    """Short commit of the app checkout, None outside git"""
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL,
+            text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def install_frappe_stub(conf=None):
+    """
+    Minimal frappe for standalone runs: only what the matcher modules call
+    while scoring (conf, logger, whitelist, _dict, as_json, throw). No site,
+    database or Redis - never used by the app itself
+    """
+    class _dict(dict):
+        __getattr__ = dict.get
+        __setattr__ = dict.__setitem__
+
+    def whitelist(*args, **kwargs):
+        return lambda fn: fn
+
+    def throw(message, *args, **kwargs):
+        raise Exception(message)
+
+    logger = logging.getLogger("image_benchmark")
+    stub = types.ModuleType("frappe")
+    stub._dict = _dict
+    stub.conf = _dict(conf or {})
+    stub.local = _dict(site=None)
+    stub.flags = _dict()
+    stub.whitelist = whitelist
+    stub.throw = throw
+    stub.logger = lambda *args, **kwargs: logger
+    stub.log_error = lambda message=None, *args, **kwargs: logger.error(message)
+    stub.as_json = lambda obj, indent=1: json.dumps(obj, indent=indent, default=str)
+    stub.parse_json = lambda value: json.loads(value) if isinstance(value, str) else value
+    sys.modules["frappe"] = stub
+    return stub
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the item image matchers on a synthetic catalogue")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser.add_argument("--queries", type=int, default=DEFAULT_QUERIES, help="query photos per perturbation")
+    parser.add_argument("--top-k", type=int, nargs="+", default=list(DEFAULT_TOP_K))
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--modes", nargs="+", help="imagehash_scan, pil_scan, indexed_brute, indexed_mih, indexed_cascade")
+    parser.add_argument("--conf", help="JSON site config values, e.g. '{\"image_match_color_weight\": 0.2}'")
+    parser.add_argument("--output")
+    args = parser.parse_args(argv)
+
+    install_frappe_stub(json.loads(args.conf) if args.conf else None)
+    run_benchmark(args.sizes, args.queries, args.top_k, args.seed, args.output, args.modes)
+
+
+if __name__ == "__main__":
+    main()
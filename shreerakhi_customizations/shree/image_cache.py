@@ -0,0 +1,127 @@
+"""
+Item Image Thumbnail Cache
+Small normalized thumbnails on local disk instead of full image bytes in Redis,
+keyed by URL + file mtime, with size-bounded LRU eviction
+Stored as PNG: a cached thumbnail has exactly the pixels of the first load and
+of the index fingerprint, so hashes and scores never depend on cache state
+Path: shreerakhi_customizations/shree/image_cache.py
+"""
+
+import hashlib
+import os
+import time
+
+import frappe
+from PIL import Image
+
+from shreerakhi_customizations.shree.image_hashing import normalize_image, read_image_source
+
+CACHE_FOLDER = "image_match_cache"
+THUMBNAIL_EXTENSION = ".png"
+DEFAULT_MAX_CACHE_MB = 512
+DEFAULT_HTTP_TTL = 24 * 60 * 60
+
+# Check the cache size after this many writes per process
+EVICTION_CHECK_INTERVAL = 100
+
+_writes_since_check = 0
+
+
+def get_cache_dir():
+    cache_dir = frappe.get_site_path("private", CACHE_FOLDER)
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+def get_cache_key(url):
+    """
+    Local files: URL + mtime, so a replaced photo gets a new entry
+    External URLs: URL + TTL bucket (site config image_cache_http_ttl)
+    """
+    from shreerakhi_customizations.shree.api import get_local_image_path
+
+    if url.startswith("http://") or url.startswith("https://"):
+        ttl = int(frappe.conf.get("image_cache_http_ttl") or DEFAULT_HTTP_TTL)
+        version = int(time.time() // ttl)
+    else:
+        version = os.stat(get_local_image_path(url)).st_mtime_ns
+
+    return hashlib.md5(f"{url}:{version}".encode()).hexdigest()
+
+
+def get_thumbnail(url):
+    """
+    Normalized RGB thumbnail of an image URL, from disk cache if present
+    """
+    from shreerakhi_customizations.shree.image_index import get_image_source
+
+    path = os.path.join(get_cache_dir(), get_cache_key(url) + THUMBNAIL_EXTENSION)
+
+    if os.path.exists(path):
+        try:
+            img = Image.open(path)
+            img.load()
+            # mtime doubles as last-access time for LRU eviction
+            os.utime(path)
+            return img
+        except OSError:
+            # Corrupt entry - rebuild it below
+            pass
+
+    source = get_image_source(url)
+    if source is None:
+        raise OSError(f"Could not fetch image {url}")
+
+    img = normalize_image(read_image_source(source))
+    save_thumbnail(img, path)
+    return img
+
+
+def save_thumbnail(img, path):
+    """Write atomically so concurrent readers never see a partial file"""
+    global _writes_since_check
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    # Lossless - speed over size, thumbnails are at most NORMALIZED_MAX_EDGE pixels
+    img.save(tmp_path, "PNG", compress_level=1)
+    os.replace(tmp_path, path)
+
+    _writes_since_check += 1
+    if _writes_since_check >= EVICTION_CHECK_INTERVAL:
+        _writes_since_check = 0
+        evict_thumbnails()
+
+
+def evict_thumbnails(max_mb=None):
+    """
+    Delete least recently used thumbnails until the cache is under 90% of its limit
+    Limit: site config image_cache_max_mb
+    """
+    max_bytes = int(max_mb or frappe.conf.get("image_cache_max_mb") or DEFAULT_MAX_CACHE_MB) * 1024 * 1024
+
+    entries = []
+    total = 0
+    with os.scandir(get_cache_dir()) as it:
+        for entry in it:
+            if entry.is_file():
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+    if total <= max_bytes:
+        return 0
+
+    removed = 0
+    target = max_bytes * 0.9
+    for _, size, path in sorted(entries):
+        if total <= target:
+            break
+        try:
+            os.remove(path)
+            total -= size
+            removed += 1
+        except OSError:
+            continue
+
+    frappe.logger().info(f"Image cache eviction removed {removed} thumbnails")
+    return removed
@@ -0,0 +1,291 @@
+"""
+Image Matching Engine
+One scan pipeline behind every image-matching endpoint: load and fingerprint
+the upload once, then try the scoring strategies in order until one returns
+a result. Each strategy is timed separately (timings["strategy_ms"])
+Path: shreerakhi_customizations/shree/image_engine.py
+"""
+
+import hashlib
+import time
+
+import frappe
+
+from shreerakhi_customizations.shree.api import (
+    IMAGEHASH_AVAILABLE,
+    MATCH_LIMIT,
+    ScanStream,
+    cache_result,
+    enrich_matches,
+    get_cached_result,
+    get_scannable_items,
+    get_upload_content_hash,
+    load_image_from_url,
+    match_against_image_index,
+    shortlist_by_dhash,
+)
+from shreerakhi_customizations.shree.image_features import ImageFingerprint
+
+# Built-in strategies, tried in this order; a strategy returns a scan result or
+# None to fall through to the next one
+STRATEGIES = {
+    "indexed": "shreerakhi_customizations.shree.image_engine.match_indexed",
+    "full_scan": "shreerakhi_customizations.shree.image_engine.match_full_scan",
+}
+
+# Apps add strategies (dotted paths, tried before the built-in ones) with this hook
+STRATEGY_HOOK = "image_match_strategies"
+
+
+class ImageScan:
+    """
+    What every strategy gets: the upload and its fingerprint, scan options, and
+    the items in scope - fetched from the database only when a strategy reads them
+    """
+
+    __slots__ = ("_items", "content_hash", "query", "scope", "search_mode", "stream", "timings", "uploaded_img")
+
+    def __init__(self, uploaded_img, content_hash, query, scope, search_mode, stream=None, timings=None):
+        self.uploaded_img = uploaded_img
+        self.content_hash = content_hash
+        self.query = query
+        self.scope = scope
+        self.search_mode = search_mode
+        self.stream = stream
+        self.timings = {} if timings is None else timings
+        self._items = None
+
+    @property
+    def items(self):
+        if self._items is None:
+            self._items = get_scannable_items(self.scope)
+        return self._items
+
+
+def get_strategies():
+    """
+    [(name, function)] in the order tried
+    Site config image_match_strategies overrides the order with a list of
+    built-in names and/or dotted paths
+    """
+    order = frappe.conf.get("image_match_strategies") or [*frappe.get_hooks(STRATEGY_HOOK), *STRATEGIES]
+    return [(name, frappe.get_attr(STRATEGIES.get(name, name))) for name in order]
+
+
+def match_image(image_url, search_mode=None, scan_id=None, scope=None):
+    """
+    Ranked matches of an uploaded image
+    search_mode: "brute", "mih" or "cascade" (default: site config)
+    scan_id: stream partial top-K and progress on the image_scan_progress realtime event
+    scope: {field: value} of image_search.SCOPE_FIELDS, an item group includes its subgroups
+    """
+    from shreerakhi_customizations.shree import image_search
+
+    started = time.perf_counter()
+    timings = {}
+    try:
+        search_mode = image_search.get_search_mode(search_mode)
+        scope = image_search.normalize_scope(scope)
+
+        # Repeat scan of the same upload against an unchanged index - answered before decoding
+        content_hash = get_upload_content_hash(image_url) if IMAGEHASH_AVAILABLE else None
+        cached = content_hash and get_cached_result(content_hash, search_mode, scope)
+        if cached:
+            return finish_scan(cached, started, timings)
+
+        # Load uploaded image
+        stage_start = time.perf_counter()
+        uploaded_img = load_image_from_url(image_url)
+        timings["load_ms"] = round((time.perf_counter() - stage_start) * 1000, 3)
+        if not uploaded_img:
+            return finish_scan({"success": False, "message": "Failed to load uploaded image"}, started, timings)
+
+        if IMAGEHASH_AVAILABLE and not content_hash:
+            # No File record (external URL): the decoded thumbnail is identical on every load
+            content_hash = hashlib.md5(uploaded_img.tobytes()).hexdigest()
+            cached = get_cached_result(content_hash, search_mode, scope)
+            if cached:
+                return finish_scan(cached, started, timings)
+
+        # Fingerprint the uploaded image once for the whole scan
+        stage_start = time.perf_counter()
+        query = ImageFingerprint.from_image(uploaded_img)
+        timings["hash_ms"] = round((time.perf_counter() - stage_start) * 1000, 3)
+
+        # Strategies set the stream total once they know how many items they check
+        scan = ImageScan(
+            uploaded_img, content_hash, query, scope, search_mode, ScanStream(scan_id, 0) if scan_id else None, timings
+        )
+
+        strategy_ms = timings["strategy_ms"] = {}
+        for name, strategy in get_strategies():
+            stage_start = time.perf_counter()
+            result = strategy(scan)
+            strategy_ms[name] = round((time.perf_counter() - stage_start) * 1000, 3)
+            if result:
+                result["strategy"] = name
+                finish_scan(result, started, timings)
+                if scan.stream and result.get("success"):
+                    scan.stream.publish(result["matches"], scan.stream.total, "done", done=True)
+                return result
+
+        return finish_scan({"success": False, "message": "No matching strategy available"}, started, timings)
+
+    except Exception as e:
+        frappe.log_error(f"Image matching error: {e}")
+        return finish_scan({"success": False, "message": str(e)}, started, timings)
+
+
+def finish_scan(result, started, timings):
+    """Add the total scan time and record the scan in the rolling telemetry"""
+    from shreerakhi_customizations.shree.image_telemetry import record_scan
+
+    timings["total_ms"] = round((time.perf_counter() - started) * 1000, 3)
+    result["timings"] = timings
+    record_scan(result)
+    return result
+
+
+def match_indexed(scan):
+    """
+    Score against the stored fingerprint index (imagehash)
+    Photos not indexed yet are stored by a background job, never during the
+    scan; a few local ones are fingerprinted for this scan only and merged in.
+    None without imagehash or while nothing in scope is indexed, so the full
+    scan compares every photo instead
+    """
+    from shreerakhi_customizations.shree import image_search
+    from shreerakhi_customizations.shree.image_index import (
+        fingerprint_pending_images,
+        get_unindexed_images,
+        queue_unindexed_images,
+    )
+
+    if not IMAGEHASH_AVAILABLE:
+        return None
+
+    # Cached per index version - no catalogue query while the index is unchanged
+    stage_start = time.perf_counter()
+    unindexed = image_search.filter_scope(get_unindexed_images(), scan.scope)
+    index_queued = bool(unindexed) and queue_unindexed_images(unindexed)
+
+    search_index = image_search.get_search_index()
+    if not search_index.item_count(search_index.scope_rows(scan.scope)):
+        return None
+
+    pending = fingerprint_pending_images(unindexed)
+    scan.timings["index_ms"] = round((time.perf_counter() - stage_start) * 1000, 3)
+
+    indexed = match_against_image_index(
+        scan.query, search_mode=scan.search_mode, scope=scan.scope, pending=pending
+    )
+    if not indexed:
+        return None
+
+    if scan.stream:
+        scan.stream.total = indexed["index_size"]
+    indexed["total_items_checked"] = indexed["index_size"] + len(pending)
+    indexed["pending_count"] = len(pending)
+    indexed["unindexed_count"] = len(unindexed) - len(pending)
+    indexed["skipped_count"] = indexed["unindexed_count"]
+    indexed["index_queued"] = index_queued
+    scan.timings.update(indexed["timings"])
+    cache_result(scan.content_hash, scan.search_mode, indexed, scan.scope)
+    return indexed
+
+
+def match_full_scan(scan):
+    """
+    Load and score every item photo (IMAGE_FIELDS, imagehash or PIL-only without it),
+    keeping the best score per item like the indexed path
+    With the cascade search mode a dHash-only pass shortlists
+    image_match_cascade_shortlist photos and only those get the full score
+    """
+    from shreerakhi_customizations.shree import image_search
+    from shreerakhi_customizations.shree.image_index import get_item_images
+
+    items = scan.items
+    stream = scan.stream
+    timings = scan.timings
+    if not items:
+        return {"success": False, "message": "No items with images found"}
+
+    # (item, image URL) for the main and the secondary photo of every item
+    photos = [(item, image.image) for item in items for image in get_item_images(item)]
+    frappe.logger().info(f"Found {len(items)} items with {len(photos)} valid images to scan")
+    if stream:
+        stream.total = len(photos)
+    matches = []
+    matching_method = "imagehash" if IMAGEHASH_AVAILABLE else "PIL-only"
+    scanned_count = 0
+    skipped_count = 0
+
+    color_weight = image_search.get_color_weight()
+    candidate_photos = photos
+    if scan.search_mode == "cascade":
+        stage_start = time.perf_counter()
+        candidate_photos, skipped_count = shortlist_by_dhash(
+            scan.uploaded_img, photos, image_search.get_cascade_shortlist(), stream=stream
+        )
+        timings["candidates_ms"] = round((time.perf_counter() - stage_start) * 1000, 3)
+
+    stage_start = time.perf_counter()
+    for item, image_url in candidate_photos:
+        try:
+            scanned_count += 1
+
+            # Load item image
+            item_img = load_image_from_url(image_url)
+            if not item_img:
+                skipped_count += 1
+                frappe.logger().debug(f"Skipped {item.item_code} ({image_url}) - image load failed")
+                continue
+
+            # Calculate similarity - auto-select best method
+            item_fingerprint = ImageFingerprint.from_image(item_img)
+            if IMAGEHASH_AVAILABLE:
+                similarity = scan.query.imagehash_similarity(item_fingerprint, color_weight)
+                threshold = 60  # Higher accuracy, so lower threshold
+            else:
+                similarity = scan.query.pil_similarity(item_fingerprint)
+                threshold = 65  # PIL-only needs higher threshold
+
+            # Log for debugging
+            if similarity > 40:
+                frappe.logger().info(f"[{matching_method}] Item: {item.item_code}, Similarity: {similarity}%")
+
+            # Accept matches above threshold (stock is added for the final top 20 only)
+            if similarity >= threshold:
+                matches.append((item, similarity))
+
+        except Exception as e:
+            frappe.log_error(f"Error processing item {item.get('item_code')}: {e}")
+            continue
+
+        finally:
+            if stream and stream.due():
+                partial = image_search.merge_ranked(matches, MATCH_LIMIT)
+                # Photos dropped by the cascade shortlist count as checked
+                processed = len(photos) - len(candidate_photos) + scanned_count
+                stream.publish(enrich_matches(partial), processed, "scoring")
+
+    # Best photo per item, sorted by similarity
+    matches = image_search.merge_ranked(matches, len(matches))
+    timings["score_ms"] = round((time.perf_counter() - stage_start) * 1000, 3)
+    stage_start = time.perf_counter()
+    final_matches = enrich_matches(matches[:MATCH_LIMIT])
+    timings["enrich_ms"] = round((time.perf_counter() - stage_start) * 1000, 3)
+
+    return {
+        "success": True,
+        "matches": final_matches,
+        "total_items_checked": len(items),
+        "scanned_count": scanned_count,
+        "skipped_count": skipped_count,
+        "matched_count": len(matches),
+        "matching_method": matching_method,
+        "search_mode": scan.search_mode,
+        "scope": scan.scope,
+        "timings": timings,
+        "imagehash_available": IMAGEHASH_AVAILABLE
+    }
@@ -0,0 +1,167 @@
+"""
+PIL-only Similarity Features (NumPy)
+Array-backed dHash/aHash/histogram/thumbnail metrics used when imagehash is missing,
+numerically the same as the original per-pixel Python loops, batchable over
+many candidate images at once
+Path: shreerakhi_customizations/shree/image_features.py
+"""
+
+import numpy as np
+from PIL import Image
+
+from shreerakhi_customizations.shree.image_hashing import (
+    HASH_BITS,
+    IMAGEHASH_AVAILABLE,
+    blend_color_similarity,
+    compute_image_hashes,
+    pack_hashes,
+    popcount_rows,
+    score_hash_distances,
+)
+
+PIL_HASH_SIZE = 16
+THUMBNAIL_SIZE = (64, 64)
+HISTOGRAM_SIZE = (256, 256)
+
+# Weights of the PIL-only score
+PIL_WEIGHTS = {
+    "dhash": 0.35,
+    "ahash": 0.30,
+    "histogram": 0.20,
+    "thumbnail": 0.15,
+}
+
+
+def dhash_bits(img, hash_size=PIL_HASH_SIZE):
+    """Difference hash: left pixel brighter than right neighbour, (hash_size^2,) bool"""
+    pixels = np.asarray(
+        img.resize((hash_size + 1, hash_size), Image.LANCZOS).convert('L'), dtype=np.int16
+    )
+    return (pixels[:, :-1] > pixels[:, 1:]).ravel()
+
+
+def ahash_bits(img, hash_size=PIL_HASH_SIZE):
+    """Average hash: pixel brighter than the mean, (hash_size^2,) bool"""
+    pixels = np.asarray(img.resize((hash_size, hash_size), Image.LANCZOS).convert('L'), dtype=np.float64)
+    return (pixels > pixels.mean()).ravel()
+
+
+def rgb_histogram(img):
+    """Per-channel 256-bin histogram of the 256x256 resize, (3, 256) float64"""
+    resized = img.resize(HISTOGRAM_SIZE, Image.LANCZOS)
+    return np.asarray(resized.histogram()[:768], dtype=np.float64).reshape(3, 256)
+
+
+def thumbnail_vector(img, size=THUMBNAIL_SIZE):
+    """Flattened RGB pixels of the thumbnail, (w*h*3,) int32"""
+    return np.asarray(img.resize(size, Image.LANCZOS), dtype=np.int32).ravel()
+
+
+def bit_similarity(bits, candidates):
+    """Share of equal bits (0-100) of one hash against (N, B) candidate hashes"""
+    candidates = np.atleast_2d(candidates)
+    differences = np.count_nonzero(candidates != bits, axis=1)
+    return np.maximum(0, (1 - differences / bits.size) * 100)
+
+
+def histogram_similarity_scores(histogram, candidates):
+    """Chi-square histogram similarity (0-100) against (N, 3, 256) candidate histograms"""
+    candidates = candidates.reshape(-1, 3, 256)
+    total = candidates + histogram
+    diff_sq = (candidates - histogram) ** 2
+    chi = np.divide(diff_sq, total, out=np.zeros_like(diff_sq), where=total != 0).sum(axis=2)
+    avg_chi = chi.mean(axis=1)
+    return np.minimum(100, np.maximum(0, 100 - (avg_chi / 500)))
+
+
+def thumbnail_similarity_scores(thumbnail, candidates):
+    """Mean squared pixel error similarity (0-100) against (N, P) candidate thumbnails"""
+    candidates = np.atleast_2d(candidates)
+    diff = candidates.astype(np.int64) - thumbnail
+    mse = np.einsum("ij,ij->i", diff, diff) / thumbnail.size
+    return np.minimum(100, np.maximum(0, 100 - (mse / 650)))
+
+
+def extract_pil_features(img):
+    """All four PIL-only features of one image"""
+    return {
+        "dhash": dhash_bits(img),
+        "ahash": ahash_bits(img),
+        "histogram": rgb_histogram(img),
+        "thumbnail": thumbnail_vector(img),
+    }
+
+
+def stack_pil_features(features):
+    """List of feature dicts -> dict of (N, ...) arrays for batch scoring"""
+    return {key: np.stack([f[key] for f in features]) for key in PIL_WEIGHTS}
+
+
+def pil_similarity_scores(query, candidates):
+    """
+    Weighted PIL-only similarity of one query against stacked candidate features
+    dHash 35%, aHash 30%, histogram 20%, thumbnail 15%, (N,) scores rounded to 2 places
+    """
+    final_score = (
+        bit_similarity(query["dhash"], candidates["dhash"]) * PIL_WEIGHTS["dhash"] +
+        bit_similarity(query["ahash"], candidates["ahash"]) * PIL_WEIGHTS["ahash"] +
+        histogram_similarity_scores(query["histogram"], candidates["histogram"]) * PIL_WEIGHTS["histogram"] +
+        thumbnail_similarity_scores(query["thumbnail"], candidates["thumbnail"]) * PIL_WEIGHTS["thumbnail"]
+    )
+    return np.round(final_score, 2)
+
+
+class ImageFingerprint:
+    """
+    Everything the matchers compare, computed once per image:
+    packed aHash/pHash/dHash/wHash words (imagehash) and the PIL-only feature arrays
+    """
+
+    __slots__ = ("ahash_bits", "dhash_bits", "hashes", "histogram", "thumbnail")
+
+    def __init__(self, hashes=None, pil_features=None):
+        self.hashes = hashes
+        pil_features = pil_features or {}
+        self.dhash_bits = pil_features.get("dhash")
+        self.ahash_bits = pil_features.get("ahash")
+        self.histogram = pil_features.get("histogram")
+        self.thumbnail = pil_features.get("thumbnail")
+
+    @classmethod
+    def from_image(cls, img, with_hashes=IMAGEHASH_AVAILABLE, with_pil=not IMAGEHASH_AVAILABLE):
+        """Only the feature sets the active matching method needs are computed"""
+        return cls(
+            hashes=pack_hashes(compute_image_hashes(img)) if with_hashes else None,
+            pil_features=extract_pil_features(img) if with_pil else None,
+        )
+
+    @property
+    def pil_features(self):
+        return {
+            "dhash": self.dhash_bits,
+            "ahash": self.ahash_bits,
+            "histogram": self.histogram,
+            "thumbnail": self.thumbnail,
+        }
+
+    def hash_distance(self, other, key):
+        """Hamming distance for one hash type, None if either side lacks it"""
+        if self.hashes.get(key) is None or other.hashes.get(key) is None:
+            return None
+        return int(popcount_rows(np.bitwise_xor(self.hashes[key], other.hashes[key]))[0])
+
+    def imagehash_similarity(self, other, color_weight=0):
+        """
+        Weighted hash score (score_hash_distances), with color_weight the
+        colour signature similarity is blended in as in the search index
+        """
+        score = score_hash_distances(*(self.hash_distance(other, key) for key in HASH_BITS))
+        if color_weight and self.hashes.get("color_signature") is not None \
+                and other.hashes.get("color_signature") is not None:
+            color_similarity = float(np.clip(self.hashes["color_signature"] @ other.hashes["color_signature"], 0, 1))
+            score = round(blend_color_similarity(score, color_similarity, color_weight), 2)
+        return score
+
+    def pil_similarity(self, other):
+        """PIL-only score (pil_similarity_scores)"""
+        return float(pil_similarity_scores(self.pil_features, stack_pil_features([other.pil_features]))[0])
@@ -0,0 +1,125 @@
+"""
+External Image Fetcher
+Pooled, concurrent download of http(s) item images for the matcher and index builder:
+shared keep-alive session, bounded threads, per-host limits, short timeouts and
+a negative cache for failing URLs
+Path: shreerakhi_customizations/shree/image_fetch.py
+"""
+
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import frappe
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_MAX_CONCURRENCY = 16
+DEFAULT_PER_HOST_LIMIT = 4
+DEFAULT_CONNECT_TIMEOUT = 3
+DEFAULT_READ_TIMEOUT = 10
+DEFAULT_FAILURE_TTL = 30 * 60
+
+USER_AGENT = 'Mozilla/5.0'
+
+_session = None
+_session_lock = threading.Lock()
+_host_limits = {}
+_host_limits_lock = threading.Lock()
+
+
+def get_fetch_config():
+    """Fetcher limits from site config (image_fetch_*)"""
+    conf = frappe.conf
+    return {
+        "max_concurrency": int(conf.get("image_fetch_concurrency") or DEFAULT_MAX_CONCURRENCY),
+        "per_host": int(conf.get("image_fetch_per_host") or DEFAULT_PER_HOST_LIMIT),
+        "timeout": (
+            float(conf.get("image_fetch_connect_timeout") or DEFAULT_CONNECT_TIMEOUT),
+            float(conf.get("image_fetch_read_timeout") or DEFAULT_READ_TIMEOUT),
+        ),
+        "failure_ttl": int(conf.get("image_fetch_failure_ttl") or DEFAULT_FAILURE_TTL),
+    }
+
+
+def get_session(pool_size=DEFAULT_MAX_CONCURRENCY):
+    """Process-wide keep-alive session with a connection pool"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers.update({'User-Agent': USER_AGENT})
+            _session = session
+        return _session
+
+
+def get_host_limit(host, per_host):
+    with _host_limits_lock:
+        if host not in _host_limits:
+            _host_limits[host] = threading.BoundedSemaphore(per_host)
+        return _host_limits[host]
+
+
+def failure_cache_key(url):
+    return f"image_fetch_failed:{hashlib.md5(url.encode()).hexdigest()}"
+
+
+def is_known_failure(url):
+    return bool(frappe.cache().get_value(failure_cache_key(url)))
+
+
+def remember_failure(url, ttl):
+    frappe.cache().set_value(failure_cache_key(url), 1, expires_in_sec=ttl)
+
+
+def download(url, session, timeout, per_host):
+    """
+    Runs in fetcher threads - no frappe calls
+    Returns (content, None) or (None, error message)
+    """
+    try:
+        with get_host_limit(urlparse(url).netloc, per_host):
+            response = session.get(url, timeout=timeout)
+        if response.status_code != 200:
+            return None, f"HTTP {response.status_code}"
+        return response.content, None
+    except requests.RequestException as e:
+        return None, str(e)
+
+
+def fetch_images(urls, session=None):
+    """
+    Download many external images concurrently
+    Returns {url: bytes or None}; failures are negatively cached for image_fetch_failure_ttl
+    """
+    config = get_fetch_config()
+    session = session or get_session(config["max_concurrency"])
+
+    results = {}
+    pending = []
+    for url in dict.fromkeys(urls):
+        if is_known_failure(url):
+            results[url] = None
+        else:
+            pending.append(url)
+
+    if not pending:
+        return results
+
+    workers = min(config["max_concurrency"], len(pending))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        downloads = executor.map(
+            lambda url: download(url, session, config["timeout"], config["per_host"]),
+            pending
+        )
+        for url, (content, error) in zip(pending, downloads, strict=True):
+            results[url] = content
+            if error:
+                remember_failure(url, config["failure_ttl"])
+                frappe.logger().warning(f"Image fetch failed for {url}: {error}")
+
+    return results
@@ -0,0 +1,224 @@
+"""
+Image Fingerprint Hashing
+Pure PIL/imagehash functions with no frappe calls, so they can run in worker processes
+Path: shreerakhi_customizations/shree/image_hashing.py
+"""
+
+import base64
+import hashlib
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+try:
+    import imagehash
+    IMAGEHASH_AVAILABLE = True
+except ImportError:
+    IMAGEHASH_AVAILABLE = False
+
+
+# Longest edge of the normalized image every matcher works on
+# (the PIL-only histogram resizes to 256x256, hashes to 64x64 or less)
+NORMALIZED_MAX_EDGE = 256
+
+# Hash bit lengths - must match compute_image_hashes
+HASH_BITS = {
+    "ahash": 256,
+    "phash": 256,
+    "dhash": 256,
+    "whash": 64,
+}
+
+# Colour signature: HSV histogram quantized to hue x saturation x value bins
+# Grayscale hashes cannot tell apart rakhis that differ only in thread/stone colour
+COLOR_BINS = (8, 4, 4)
+COLOR_SIGNATURE_SIZE = COLOR_BINS[0] * COLOR_BINS[1] * COLOR_BINS[2]
+
+# Share of the final score taken by colour similarity (site config image_match_color_weight)
+DEFAULT_COLOR_WEIGHT = 0.15
+
+
+# Bits set per byte, for NumPy builds without bitwise_count
+_POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def popcount_rows(words):
+    """Number of set bits per row of a (N, W) uint64 matrix"""
+    words = np.atleast_2d(words)
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words).sum(axis=1, dtype=np.uint16)
+    bytes_view = np.ascontiguousarray(words).view(np.uint8).reshape(words.shape[0], -1)
+    return _POPCOUNT_TABLE[bytes_view].sum(axis=1, dtype=np.uint16)
+
+
+def unpack_sign_bits(words):
+    """
+    (N, W) uint64 matrix -> (N, W*64) float32 matrix of +1/-1 per bit
+    Hamming distance is then (bits - A @ B.T) / 2, a single matrix product
+    """
+    words = np.atleast_2d(words)
+    bits = np.unpackbits(words.astype(">u8").view(np.uint8).reshape(words.shape[0], -1), axis=1)
+    return bits.astype(np.float32) * 2 - 1
+
+
+def pack_hex_hashes(hex_values, bits):
+    """
+    Hex hash strings -> (N, bits/64) uint64 matrix
+    Missing values become zero rows, returned with a validity mask
+    """
+    words = bits // 64
+    width = bits // 4
+    valid = np.array([bool(v) and len(v) == width for v in hex_values], dtype=bool)
+    blob = "".join(v if ok else "0" * width for v, ok in zip(hex_values, valid, strict=True))
+    matrix = np.frombuffer(bytes.fromhex(blob), dtype=">u8").astype(np.uint64)
+    return matrix.reshape(len(hex_values), words), valid
+
+
+def pack_hashes(hashes):
+    """
+    Hex hashes of one image -> {hash_type: (W,) uint64 words or None}
+    plus the decoded colour signature under "color_signature"
+    """
+    packed = {}
+    for key, bits in HASH_BITS.items():
+        matrix, valid = pack_hex_hashes([hashes.get(key) or ""], bits)
+        packed[key] = matrix[0] if valid[0] else None
+    packed["color_signature"] = decode_color_signature(hashes.get("color_signature"))
+    return packed
+
+
+def color_signature(img):
+    """
+    Quantized HSV histogram of an RGB image, (COLOR_SIGNATURE_SIZE,) float32
+    Square roots of the bin shares, so the vector has unit length and the
+    cosine similarity of two signatures is their dot product
+    """
+    hsv = np.asarray(img.convert('HSV'), dtype=np.uint16)
+    hue = hsv[..., 0] * COLOR_BINS[0] >> 8
+    saturation = hsv[..., 1] * COLOR_BINS[1] >> 8
+    value = hsv[..., 2] * COLOR_BINS[2] >> 8
+    bins = (hue * COLOR_BINS[1] + saturation) * COLOR_BINS[2] + value
+
+    counts = np.bincount(bins.ravel(), minlength=COLOR_SIGNATURE_SIZE).astype(np.float32)
+    return np.sqrt(counts / max(counts.sum(), 1))
+
+
+def encode_color_signature(signature):
+    """float32 vector -> base64 text for the fingerprint row"""
+    return base64.b64encode(np.asarray(signature, dtype="<f4").tobytes()).decode()
+
+
+def decode_color_signature(text):
+    """Stored base64 text -> float32 vector, None if missing or malformed"""
+    if not text:
+        return None
+    try:
+        signature = np.frombuffer(base64.b64decode(text), dtype="<f4")
+    except ValueError:
+        return None
+    if signature.size != COLOR_SIGNATURE_SIZE:
+        return None
+    return signature.astype(np.float32)
+
+
+def pack_color_signatures(values):
+    """
+    Stored signatures -> (N, COLOR_SIGNATURE_SIZE) float32 matrix
+    Missing values become zero rows, returned with a validity mask
+    """
+    matrix = np.zeros((len(values), COLOR_SIGNATURE_SIZE), dtype=np.float32)
+    valid = np.zeros(len(values), dtype=bool)
+    for row, text in enumerate(values):
+        signature = decode_color_signature(text)
+        if signature is not None:
+            matrix[row] = signature
+            valid[row] = True
+    return matrix, valid
+
+
+def blend_color_similarity(hash_score, color_similarity, color_weight=DEFAULT_COLOR_WEIGHT):
+    """Hash score (0-100) blended with colour cosine similarity (0-1)"""
+    return (1 - color_weight) * hash_score + color_weight * color_similarity * 100
+
+
+def compute_image_hashes(img):
+    """
+    Compute aHash/pHash/dHash/wHash of an image as hex strings (16x16 aHash/pHash/dHash,
+    default 8x8 wHash), plus the encoded colour signature
+    """
+    hashes = {
+        "ahash": str(imagehash.average_hash(img, hash_size=16)),
+        "phash": str(imagehash.phash(img, hash_size=16)),
+        "dhash": str(imagehash.dhash(img, hash_size=16)),
+        "whash": "",
+        "color_signature": encode_color_signature(color_signature(img)),
+    }
+    try:
+        hashes["whash"] = str(imagehash.whash(img))
+    except Exception:
+        # Same as the scorer: wavelet hash is optional
+        pass
+    return hashes
+
+
+def score_hash_distances(ahash_diff, phash_diff, dhash_diff, whash_diff=None):
+    """
+    Weighted similarity (0-100) from Hamming distances
+    whash_diff=None means wavelet hash was not available
+    """
+    ahash_sim = max(0, 100 - (ahash_diff * 100 / 256))
+    phash_sim = max(0, 100 - (phash_diff * 100 / 256))
+    dhash_sim = max(0, 100 - (dhash_diff * 100 / 256))
+    whash_sim = 0 if whash_diff is None else max(0, 100 - (whash_diff * 100 / 64))
+
+    final_score = (
+        ahash_sim * 0.30 +
+        phash_sim * 0.35 +
+        dhash_sim * 0.25 +
+        whash_sim * 0.10
+    )
+
+    # Bonus for high agreement
+    if ahash_sim > 90 and phash_sim > 90 and dhash_sim > 90:
+        final_score = min(100, final_score + 5)
+
+    return round(final_score, 2)
+
+
+def read_image_source(source):
+    """
+    Decode a local file path or already downloaded bytes to an RGB image
+    (external images are fetched by image_fetch.py, not in workers)
+    """
+    if isinstance(source, bytes):
+        img_data = source
+    else:
+        with open(source, "rb") as f:
+            img_data = f.read()
+
+    img = Image.open(BytesIO(img_data))
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    return img
+
+
+def normalize_image(img):
+    """RGB copy no larger than NORMALIZED_MAX_EDGE, aspect ratio kept"""
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    if max(img.size) > NORMALIZED_MAX_EDGE:
+        img = img.copy()
+        img.thumbnail((NORMALIZED_MAX_EDGE, NORMALIZED_MAX_EDGE), Image.LANCZOS)
+    return img
+
+
+def fingerprint_image_source(source):
+    """
+    Hashes of one image plus the MD5 of its decoded pixels
+    Run through image_workers.map_isolated for per-image error isolation
+    """
+    img = read_image_source(source)
+    fingerprint = compute_image_hashes(normalize_image(img))
+    fingerprint["pixel_md5"] = hashlib.md5(img.tobytes()).hexdigest()
+    return fingerprint
@@ -0,0 +1,593 @@
+"""
+Item Image Fingerprint Index
+Precomputed perceptual hashes and colour signatures per Item, so scans only hash the uploaded image
+Path: shreerakhi_customizations/shree/image_index.py
+"""
+
+import os
+import time
+
+import frappe
+
+from shreerakhi_customizations.shree.api import get_local_image_path
+from shreerakhi_customizations.shree.image_hashing import (
+    HASH_BITS,
+    IMAGEHASH_AVAILABLE,
+    compute_image_hashes,
+    fingerprint_image_source,
+)
+from shreerakhi_customizations.shree.image_workers import image_pool, map_isolated
+
+FINGERPRINT_DOCTYPE = "Item Image Fingerprint"
+INDEX_VERSION_KEY = "item_image_index_version"
+REBUILD_STATE_KEY = "item_image_index_rebuild_state"
+REBUILD_JOB_ID = "item_image_index_rebuild"
+REBUILD_CHUNK_SIZE = 200
+UNINDEXED_JOB_ID = "item_image_index_unindexed"
+UNINDEXED_CACHE_KEY = "item_image_unindexed"
+UNINDEXED_CACHE_TTL = 24 * 60 * 60
+
+# Unindexed local photos a scan fingerprints for itself while the job catches up
+# (site config image_match_inline_fingerprints, 0 disables)
+DEFAULT_INLINE_FINGERPRINTS = 20
+
+# Redis hash "item:image_field" -> failure of photos that could not be fingerprinted
+# (see record_failed_images); a full rebuild clears it
+FAILED_ITEMS_KEY = "item_image_fingerprint_failed"
+# Download failures are retried after this many seconds; photos that are missing
+# or cannot be decoded wait until the file itself changes
+FAILED_RETRY_AFTER = 60 * 60
+
+# Item fields holding photos that get their own fingerprint row
+IMAGE_FIELDS = ("image", "custom_2nd_image_link")
+
+
+def get_index_version():
+    """
+    Version token of the fingerprint index, changes on every index write
+    In-memory search indexes reload when it changes
+    """
+    version = frappe.cache().get_value(INDEX_VERSION_KEY)
+    if not version:
+        version = bump_index_version()
+    return version
+
+
+def bump_index_version():
+    version = frappe.generate_hash(length=12)
+    frappe.cache().set_value(INDEX_VERSION_KEY, version)
+    return version
+
+
+def bump_index_version_after_commit():
+    """Bump only once the fingerprint write is visible to other workers"""
+    frappe.db.after_commit.add(bump_index_version)
+
+
+def get_image_source_key(url):
+    """
+    Change-detection key for an image
+    Local files: mtime:size, external URLs: None (keyed after download)
+    """
+    if not url or url.startswith("http://") or url.startswith("https://"):
+        return None
+
+    try:
+        stat = os.stat(get_local_image_path(url))
+        return f"{int(stat.st_mtime)}:{stat.st_size}"
+    except OSError:
+        return None
+
+
+def is_indexable_url(url):
+    return bool(url) and (url.startswith("http") or url.startswith("/files/"))
+
+
+def get_item_images(item):
+    """
+    One entry (name, image_field, image) per photo of an Item row
+    that carries the IMAGE_FIELDS columns
+    """
+    return [
+        frappe._dict(name=item.name, image_field=field, image=item.get(field))
+        for field in IMAGE_FIELDS
+        if is_indexable_url(item.get(field))
+    ]
+
+
+def get_indexed_items():
+    """
+    Fingerprints of all enabled Items whose photo is unchanged, one row per photo,
+    grouped by item (main image first)
+    """
+    return frappe.db.sql("""
+        SELECT
+            i.name,
+            i.item_code,
+            i.item_name,
+            i.image,
+            i.item_group,
+            i.custom_item_range,
+            i.custom_item_category,
+            f.image_field,
+            f.ahash,
+            f.phash,
+            f.dhash,
+            f.whash,
+            f.color_signature
+        FROM `tabItem Image Fingerprint` f
+        INNER JOIN `tabItem` i ON i.name = f.item_code
+        WHERE i.disabled = 0
+            AND f.hash_method = 'imagehash'
+            AND (
+                (f.image_field = 'image' AND f.image_url = i.image)
+                OR (f.image_field = 'custom_2nd_image_link' AND f.image_url = i.custom_2nd_image_link)
+            )
+        ORDER BY i.name, f.image_field = 'image' DESC
+    """, as_dict=1)
+
+
+def get_unindexed_images(cached=True):
+    """
+    Photos of enabled Items without a current fingerprint, as get_item_images
+    entries with the item details, including photos that failed to fingerprint
+    The list is cached per index version, so scans only query it again after
+    the index changed
+    """
+    cache_key = f"{UNINDEXED_CACHE_KEY}:{get_index_version()}"
+    images = frappe.cache().get_value(cache_key) if cached else None
+    if images is None:
+        # One anti-join per photo field, same fingerprint match as get_indexed_items
+        selects = [f"""
+            SELECT
+                i.name,
+                i.item_code,
+                i.item_name,
+                i.item_group,
+                i.custom_item_range,
+                i.custom_item_category,
+                '{field}' AS image_field,
+                i.{field} AS image
+            FROM `tabItem` i
+            LEFT JOIN `tabItem Image Fingerprint` f
+                ON f.item_code = i.name
+                AND f.image_field = '{field}'
+                AND f.image_url = i.{field}
+                AND f.hash_method = 'imagehash'
+            WHERE i.disabled = 0
+                AND (i.{field} LIKE 'http%' OR i.{field} LIKE '/files/%')
+                AND f.name IS NULL
+        """ for field in IMAGE_FIELDS]
+        images = frappe.db.sql(" UNION ALL ".join(selects) + " ORDER BY name", as_dict=1)
+        frappe.cache().set_value(cache_key, images, expires_in_sec=UNINDEXED_CACHE_TTL)
+
+    return images
+
+
+def get_inline_fingerprint_limit():
+    limit = frappe.conf.get("image_match_inline_fingerprints")
+    return DEFAULT_INLINE_FINGERPRINTS if limit is None else max(0, int(limit))
+
+
+def fingerprint_pending_images(images):
+    """
+    Fingerprint rows (item details and hex hashes, like get_indexed_items) of
+    up to get_inline_fingerprint_limit() local photos from get_unindexed_images,
+    for the current scan only - nothing is stored, the background job does that
+    Read from the thumbnail cache, which has the pixels the job hashes; external
+    photos are left to the job. Photos that fail here are not recorded, only the
+    job's own attempt decides whether a photo gets retried
+    """
+    from shreerakhi_customizations.shree.api import load_image_from_url
+
+    rows = []
+    local = [image for image in get_retryable_images(images) if image.image.startswith("/files/")]
+    for image in local[:get_inline_fingerprint_limit()]:
+        img = load_image_from_url(image.image)
+        if img is not None:
+            rows.append(frappe._dict(image, **compute_image_hashes(img)))
+
+    return rows
+
+
+def get_failed_images():
+    return frappe.cache().hgetall(FAILED_ITEMS_KEY) or {}
+
+
+def record_failed_images(images, permanent=False):
+    """
+    Remember photos that could not be fingerprinted
+    permanent: the file is missing or not a readable image - retried once its
+    URL or source key changes; otherwise after FAILED_RETRY_AFTER
+    """
+    failed_at = time.time()
+    for image in images:
+        frappe.cache().hset(FAILED_ITEMS_KEY, f"{image.name}:{image.image_field}", {
+            "image": image.image,
+            "source_key": get_image_source_key(image.image),
+            "permanent": permanent,
+            "failed_at": failed_at,
+        })
+
+
+def is_retry_due(failure, image):
+    """Whether a photo with this failure record should be fingerprinted again"""
+    if not failure or failure["image"] != image.image:
+        return True
+    if failure["permanent"]:
+        return failure["source_key"] != get_image_source_key(image.image)
+    return time.time() - failure["failed_at"] >= FAILED_RETRY_AFTER
+
+
+def get_retryable_images(images):
+    """Photos from get_unindexed_images that did not fail recently"""
+    failed = get_failed_images()
+    return [image for image in images if is_retry_due(failed.get(f"{image.name}:{image.image_field}"), image)]
+
+
+def queue_unindexed_images(images):
+    """
+    Fingerprint photos missing from the index (from get_unindexed_images) in a
+    background job, scans never store catalogue fingerprints
+    Not queued when that job or a full rebuild is already queued, or when every
+    photo failed recently
+    """
+    from frappe.utils.background_jobs import is_job_enqueued
+
+    if is_job_enqueued(UNINDEXED_JOB_ID) or is_job_enqueued(REBUILD_JOB_ID):
+        return False
+    if not get_retryable_images(images):
+        return False
+
+    frappe.enqueue(
+        "shreerakhi_customizations.shree.image_index.index_unindexed_images",
+        queue="long",
+        timeout=4 * 60 * 60,
+        job_id=UNINDEXED_JOB_ID,
+        deduplicate=True,
+    )
+    return True
+
+
+def index_unindexed_images():
+    """
+    Background job: fingerprint the photos listed by get_unindexed_images that
+    are due for a try, in chunks of REBUILD_CHUNK_SIZE committed one by one,
+    so scans pick up the new fingerprints while the job runs
+    """
+    images = get_retryable_images(get_unindexed_images(cached=False))
+    stats = {"updated": 0, "unchanged": 0, "failed": 0}
+
+    with image_pool() as executor:
+        for start in range(0, len(images), REBUILD_CHUNK_SIZE):
+            chunk_stats = fingerprint_images(images[start:start + REBUILD_CHUNK_SIZE], executor=executor)
+            frappe.db.commit()
+            for key in stats:
+                stats[key] += chunk_stats[key]
+
+    frappe.logger().info(f"Unindexed item photos fingerprinted: {stats}")
+    return stats
+
+
+def get_image_sources(urls):
+    """
+    What hashing workers read: site file path for local images, downloaded
+    bytes for external ones (None if the download failed)
+    """
+    from shreerakhi_customizations.shree.image_fetch import fetch_images
+
+    external = [url for url in urls if url.startswith("http://") or url.startswith("https://")]
+    downloaded = fetch_images(external) if external else {}
+
+    return [
+        downloaded.get(url) if url in downloaded else get_local_image_path(url)
+        for url in urls
+    ]
+
+
+def get_image_source(url):
+    return get_image_sources([url])[0]
+
+
+def save_item_fingerprint(item_code, image_url, source_key, hashes, existing_name=None, bump=True,
+                          image_field="image"):
+    """Insert or update the fingerprint row of one Item photo"""
+    values = {
+        "image_field": image_field,
+        "image_url": image_url,
+        "source_key": source_key,
+        "hash_method": "imagehash",
+        **{key: hashes.get(key) or "" for key in HASH_BITS},
+        "color_signature": hashes.get("color_signature") or "",
+    }
+
+    if existing_name:
+        frappe.db.set_value(FINGERPRINT_DOCTYPE, existing_name, values, update_modified=True)
+    else:
+        try:
+            frappe.get_doc({
+                "doctype": FINGERPRINT_DOCTYPE,
+                "item_code": item_code,
+                **values,
+            }).insert(ignore_permissions=True)
+        except frappe.DuplicateEntryError:
+            # Another job inserted this photo's row ({item_code}-{image_field}) first
+            frappe.db.set_value(
+                FINGERPRINT_DOCTYPE, f"{item_code}-{image_field}", values, update_modified=True
+            )
+
+    if bump:
+        bump_index_version_after_commit()
+
+
+def is_fingerprint_current(existing, image_url, source_key):
+    """Same image and source, and hashed with the current feature set (colour signature)"""
+    return bool(
+        existing and source_key
+        and existing.image_url == image_url
+        and existing.source_key == source_key
+        and existing.color_signature
+    )
+
+
+def refresh_item_fingerprint(item_code, force=False):
+    """
+    Create/update the fingerprints of one Item (main and secondary photo)
+    Skips hashing when image URL and source key are unchanged
+    Returns "updated", "unchanged", "removed" or "failed"
+    """
+    if not IMAGEHASH_AVAILABLE:
+        return "failed"
+
+    item = frappe.db.get_value("Item", item_code, ["name", "disabled", *IMAGE_FIELDS], as_dict=1)
+    images = get_item_images(item) if item and not item.disabled else []
+    if not images:
+        remove_item_fingerprint(item_code)
+        return "removed"
+
+    # Photo fields that were cleared lose their fingerprint
+    stale = frappe.get_all(
+        FINGERPRINT_DOCTYPE,
+        filters={"item_code": item.name, "image_field": ["not in", [image.image_field for image in images]]},
+        pluck="name"
+    )
+    if stale:
+        frappe.db.delete(FINGERPRINT_DOCTYPE, {"name": ["in", stale]})
+        bump_index_version_after_commit()
+
+    stats = fingerprint_images(images, force=force)
+    if stats["updated"]:
+        return "updated"
+    if stats["failed"]:
+        return "failed"
+    return "removed" if stale else "unchanged"
+
+
+def remove_item_fingerprint(item_code):
+    """Delete stored fingerprints of an Item"""
+    if frappe.db.exists(FINGERPRINT_DOCTYPE, {"item_code": item_code}):
+        frappe.db.delete(FINGERPRINT_DOCTYPE, {"item_code": item_code})
+        bump_index_version_after_commit()
+
+
+# Item fields whose change needs the image re-hashed
+FINGERPRINT_SOURCE_FIELDS = ("image", "custom_2nd_image_link", "disabled")
+
+# Item fields shown in scan results or used to scope scans - a change only reloads the search index
+FINGERPRINT_DETAIL_FIELDS = ("item_name", "item_group", "custom_item_range", "custom_item_category")
+
+
+def on_item_change(doc, method=None):
+    """
+    Item on_update (also runs on insert, where every field counts as changed):
+    queue a single-item fingerprint refresh when the image or enabled state changed
+    """
+    if not IMAGEHASH_AVAILABLE:
+        return
+
+    if any(doc.has_value_changed(f) for f in FINGERPRINT_SOURCE_FIELDS):
+        frappe.enqueue(
+            "shreerakhi_customizations.shree.image_index.refresh_item_fingerprint",
+            queue="short",
+            enqueue_after_commit=True,
+            job_id=f"item_image_fingerprint::{doc.name}",
+            deduplicate=True,
+            item_code=doc.name,
+        )
+    elif any(doc.has_value_changed(f) for f in FINGERPRINT_DETAIL_FIELDS):
+        bump_index_version_after_commit()
+
+
+def on_item_trash(doc, method=None):
+    """Item on_trash: drop its fingerprints with the item"""
+    remove_item_fingerprint(doc.name)
+
+
+def fingerprint_items(items, force=False, executor=None):
+    """
+    Fingerprint every photo of a chunk of Items (rows with name and IMAGE_FIELDS)
+    """
+    return fingerprint_images([image for item in items for image in get_item_images(item)], force, executor)
+
+
+def fingerprint_images(images, force=False, executor=None):
+    """
+    Fingerprint item photos (entries from get_item_images)
+    Unchanged images are skipped, the rest are hashed on the executor in input order
+    """
+    stats = {"updated": 0, "unchanged": 0, "failed": 0}
+    if not images:
+        return stats
+
+    # A failed download may pass, a file that is missing or does not decode will not
+    unfetched = []
+    unreadable = []
+
+    existing = {
+        (row.item_code, row.image_field or "image"): row
+        for row in frappe.get_all(
+            FINGERPRINT_DOCTYPE,
+            filters={"item_code": ["in", list({image.name for image in images})]},
+            fields=["name", "item_code", "image_field", "image_url", "source_key", "color_signature"]
+        )
+    }
+
+    pending = []
+    for image in images:
+        source_key = get_image_source_key(image.image)
+        if not force and is_fingerprint_current(existing.get((image.name, image.image_field)), image.image, source_key):
+            stats["unchanged"] += 1
+        else:
+            pending.append((image, source_key))
+
+    # External images are downloaded here (pooled), workers only decode and hash
+    fetched = []
+    for entry, source in zip(pending, get_image_sources([image.image for image, _ in pending]), strict=True):
+        if source is None:
+            stats["failed"] += 1
+            unfetched.append(entry[0])
+        else:
+            fetched.append((entry, source))
+
+    results = map_isolated(fingerprint_image_source, [source for _, source in fetched], executor=executor)
+
+    for ((image, source_key), _), (fingerprint, error) in zip(fetched, results, strict=True):
+        if error:
+            stats["failed"] += 1
+            unreadable.append(image)
+            frappe.logger().warning(f"Fingerprint failed for {image.name} ({image.image_field}): {error}")
+            continue
+
+        row = existing.get((image.name, image.image_field))
+        source_key = source_key or fingerprint["pixel_md5"]
+        if not force and is_fingerprint_current(row, image.image, source_key):
+            stats["unchanged"] += 1
+            continue
+
+        save_item_fingerprint(
+            image.name, image.image, source_key, fingerprint, row and row.name,
+            bump=False, image_field=image.image_field
+        )
+        stats["updated"] += 1
+
+    if stats["updated"]:
+        bump_index_version_after_commit()
+    record_failed_images(unfetched)
+    record_failed_images(unreadable, permanent=True)
+
+    return stats
+
+
+@frappe.whitelist()
+def rebuild_image_index(force=0):
+    """
+    Queue a background rebuild of the image fingerprint index
+    An interrupted rebuild resumes from where it stopped unless force is set
+    """
+    frappe.only_for(["System Manager", "Stock Manager"])
+
+    from frappe.utils.background_jobs import is_job_enqueued
+
+    if is_job_enqueued(REBUILD_JOB_ID):
+        return {"success": False, "message": "Image index rebuild is already running"}
+
+    frappe.enqueue(
+        "shreerakhi_customizations.shree.image_index.build_image_index",
+        queue="long",
+        timeout=4 * 60 * 60,
+        job_id=REBUILD_JOB_ID,
+        deduplicate=True,
+        force=frappe.utils.cint(force),
+        user=frappe.session.user,
+    )
+    return {"success": True, "message": "Image index rebuild queued"}
+
+
+@frappe.whitelist()
+def get_image_index_status():
+    """Index size and progress of a running/interrupted rebuild"""
+    from frappe.utils.background_jobs import is_job_enqueued
+
+    return {
+        "index_size": frappe.db.count(FINGERPRINT_DOCTYPE),
+        "rebuild_running": is_job_enqueued(REBUILD_JOB_ID),
+        "rebuild_state": frappe.cache().get_value(REBUILD_STATE_KEY),
+    }
+
+
+def publish_rebuild_progress(state, user=None):
+    frappe.publish_realtime("image_index_progress", state, user=user)
+
+
+def build_image_index(force=False, user=None):
+    """
+    Fingerprint all enabled Items with photos (IMAGE_FIELDS), in chunks of REBUILD_CHUNK_SIZE
+    Progress is saved after every chunk, so a crashed run resumes from its cursor
+    Run with: bench --site <site> execute shreerakhi_customizations.shree.image_index.build_image_index
+    """
+    item_conditions = """
+        disabled = 0
+        AND (
+            image LIKE 'http%%' OR image LIKE '/files/%%'
+            OR custom_2nd_image_link LIKE 'http%%' OR custom_2nd_image_link LIKE '/files/%%'
+        )
+    """
+
+    state = None if force else frappe.cache().get_value(REBUILD_STATE_KEY)
+    if not state:
+        # A fresh rebuild retries photos that failed before
+        frappe.cache().delete_value(FAILED_ITEMS_KEY)
+        state = {
+            "cursor": "",
+            "processed": 0,
+            "total": frappe.db.sql(f"SELECT COUNT(*) FROM `tabItem` WHERE {item_conditions}")[0][0],
+            "force": frappe.utils.cint(force),
+            "stats": {"updated": 0, "unchanged": 0, "failed": 0},
+            "done": False,
+        }
+
+    with image_pool() as executor:
+        while True:
+            items = frappe.db.sql(f"""
+                SELECT name, image, custom_2nd_image_link
+                FROM `tabItem`
+                WHERE {item_conditions}
+                    AND name > %(cursor)s
+                ORDER BY name
+                LIMIT %(limit)s
+            """, {"cursor": state["cursor"], "limit": REBUILD_CHUNK_SIZE}, as_dict=1)
+
+            if not items:
+                break
+
+            chunk_stats = fingerprint_items(items, force=state["force"], executor=executor)
+            frappe.db.commit()
+
+            for key in state["stats"]:
+                state["stats"][key] += chunk_stats[key]
+            state["processed"] += len(items)
+            state["cursor"] = items[-1].name
+            frappe.cache().set_value(REBUILD_STATE_KEY, state)
+            publish_rebuild_progress(state, user)
+
+    # Drop fingerprints of disabled/deleted items and of cleared photo fields
+    frappe.db.sql("""
+        DELETE f FROM `tabItem Image Fingerprint` f
+        LEFT JOIN `tabItem` i ON i.name = f.item_code
+        WHERE i.name IS NULL OR i.disabled = 1
+            OR (f.image_field = 'custom_2nd_image_link' AND IFNULL(i.custom_2nd_image_link, '') = '')
+            OR (f.image_field = 'image' AND IFNULL(i.image, '') = '')
+    """)
+    frappe.db.commit()
+    bump_index_version()
+
+    # Write the shared store of the new version so web workers map it instead of rebuilding
+    from shreerakhi_customizations.shree.image_search import get_search_index
+    get_search_index()
+
+    frappe.cache().delete_value(REBUILD_STATE_KEY)
+    state["done"] = True
+    publish_rebuild_progress(state, user)
+
+    frappe.logger().info(f"Image index build finished: {state['stats']}")
+    return state["stats"]
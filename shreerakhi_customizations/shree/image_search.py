@@ -0,0 +1,583 @@
+"""
+Vectorized Image Search Engine
+All indexed item hashes kept as packed uint64 NumPy matrices (one per hash type),
+scored against a query in one popcount pass
+Path: shreerakhi_customizations/shree/image_search.py
+"""
+
+import time
+from itertools import combinations
+
+import frappe
+import numpy as np
+
+from shreerakhi_customizations.shree.image_hashing import (
+    DEFAULT_COLOR_WEIGHT,
+    HASH_BITS,
+    blend_color_similarity,
+    pack_color_signatures,
+    pack_hashes,
+    pack_hex_hashes,
+    popcount_rows,
+    unpack_sign_bits,
+)
+from shreerakhi_customizations.shree.image_index import get_index_version, get_indexed_items
+
+# Weights - must match score_hash_distances
+HASH_WEIGHTS = {
+    "ahash": 0.30,
+    "phash": 0.35,
+    "dhash": 0.25,
+    "whash": 0.10,
+}
+
+# Per-site cache of the loaded index: {site: HashMatrixIndex}
+_search_index_cache = {}
+
+# Search modes: "brute" scores every item, "mih" looks up candidates
+# within a pHash radius via multi-index hashing and re-ranks only those,
+# "cascade" shortlists by dHash distance alone and fully scores the shortlist
+# mih only finds near-identical photos: cropped or rotated shots are usually
+# further than the radius from their item. On the image_benchmark catalogue
+# recall@1 is 0.55 at radius 32 (crop 0.0, rotate 0.2) against 1.0 for brute,
+# and raising the radius to 80 only reaches 0.66 while probing is 40x slower
+# than brute - keep brute (the default) for camera scans
+SEARCH_MODES = ("brute", "mih", "cascade")
+DEFAULT_MIH_RADIUS = 32
+MIH_CHUNK_BITS = 16
+DEFAULT_CASCADE_SHORTLIST = 300
+
+# Near-duplicate detection: default pHash distance and largest band bucket compared
+DEFAULT_DUPLICATE_DISTANCE = 12
+MAX_DUPLICATE_BUCKET = 500
+
+# Item fields a scan can be scoped to (Item Image Scanner filters)
+SCOPE_FIELDS = ("item_group", "custom_item_range", "custom_item_category")
+
+# Query x item cells per block in batch scoring (bounds the score temporaries)
+BATCH_BLOCK_CELLS = 1 << 20
+
+
+class HashMatrixIndex:
+    """
+    Packed hash matrices and colour signature matrix with one row per fingerprint,
+    plus item details for every indexed Item
+    An Item can have several fingerprints (main and secondary photo); matrix rows
+    map to items through row_items and results are scored best-of per item
+    """
+
+    def __init__(self, rows, version=None, arrays=None):
+        """
+        rows: fingerprint rows with item details and hex hashes
+        arrays: already packed matrices (from image_store), rows then carry details only
+        """
+        self.version = version
+        self.rows = rows
+        self.items, self.row_items = group_rows_by_item(rows)
+        self._item_starts = None
+        if len(self.row_items) and np.all(np.diff(self.row_items) >= 0):
+            # Rows already grouped per item - best-of is a single reduceat
+            self._item_starts = np.flatnonzero(np.r_[True, np.diff(self.row_items) > 0])
+        if arrays is not None:
+            self.matrices = arrays["matrices"]
+            self.valid = arrays["valid"]
+            self.colors = arrays["colors"]
+            self.color_valid = arrays["color_valid"]
+        else:
+            self.matrices = {}
+            self.valid = {}
+            for key, bits in HASH_BITS.items():
+                self.matrices[key], self.valid[key] = pack_hex_hashes([row.get(key) or "" for row in rows], bits)
+            self.colors, self.color_valid = pack_color_signatures([row.get("color_signature") for row in rows])
+        self._mih = None
+        self._sign_matrices = {}
+        self._field_codes = {}
+        self._scope_rows = {}
+
+    def __len__(self):
+        return len(self.items)
+
+    def best_per_item(self, scores, rows=None):
+        """
+        Row scores (..., R) -> best score per item (..., I), vectorized
+        Items without a scored row get -inf
+        """
+        if rows is None and self._item_starts is not None:
+            return np.maximum.reduceat(scores, self._item_starts, axis=-1)
+
+        item_ids = self.row_items if rows is None else self.row_items[rows]
+        best = np.full((*scores.shape[:-1], len(self.items)), -np.inf)
+        if scores.ndim == 1:
+            np.maximum.at(best, item_ids, scores)
+        else:
+            np.maximum.at(best, (slice(None), item_ids), scores)
+        return best
+
+    def distances(self, query, key, rows=None):
+        """Hamming distance of every fingerprint row (or the given rows) to the query for one hash type"""
+        matrix = self.matrices[key] if rows is None else self.matrices[key][rows]
+        return popcount_rows(np.bitwise_xor(matrix, query[key]))
+
+    def color_similarities(self, query, rows=None):
+        """Cosine similarity (0-1) of every item's colour signature to the query's"""
+        matrix = self.colors if rows is None else self.colors[rows]
+        return np.clip(matrix @ query["color_signature"], 0, 1)
+
+    def scores(self, query, rows=None, color_weight=0):
+        """
+        Weighted similarity (0-100) of every item, same formula as score_hash_distances
+        With color_weight, items that have a colour signature get it blended in
+        With rows given, only those items are scored (in that order)
+        """
+        distances = {key: self.distances(query, key, rows) for key in ("ahash", "phash", "dhash")}
+
+        whash_valid = None
+        if query.get("whash") is not None:
+            distances["whash"] = self.distances(query, "whash", rows)
+            whash_valid = self.valid["whash"] if rows is None else self.valid["whash"][rows]
+
+        color_similarity = color_valid = None
+        if color_weight and query.get("color_signature") is not None:
+            color_similarity = self.color_similarities(query, rows)
+            color_valid = self.color_valid if rows is None else self.color_valid[rows]
+
+        return score_distances(distances, whash_valid, color_similarity, color_valid, color_weight)
+
+    def batch_scores(self, queries, color_weight=0):
+        """
+        (Q, R) scores of every query image against every fingerprint row (queries
+        is a HashMatrixIndex of the query fingerprints), see best_per_item. Hamming distances come from one
+        matrix product per hash type over +1/-1 bit matrices, per block of queries
+        """
+        scores = np.zeros((len(queries.rows), len(self.rows)), dtype=np.float64)
+        if not len(self.rows) or not len(queries.rows):
+            return scores
+
+        block = max(1, BATCH_BLOCK_CELLS // len(self.rows))
+        for start in range(0, len(queries.rows), block):
+            rows = slice(start, start + block)
+
+            distances = {}
+            for key, bits in HASH_BITS.items():
+                query_signs = unpack_sign_bits(queries.matrices[key][rows])
+                distances[key] = np.rint((bits - query_signs @ self.sign_matrix(key).T) / 2).astype(np.uint16)
+
+            whash_valid = queries.valid["whash"][rows, None] & self.valid["whash"][None, :]
+
+            color_similarity = color_valid = None
+            if color_weight:
+                color_similarity = np.clip(queries.colors[rows] @ self.colors.T, 0, 1)
+                color_valid = queries.color_valid[rows, None] & self.color_valid[None, :]
+
+            scores[rows] = score_distances(distances, whash_valid, color_similarity, color_valid, color_weight)
+
+        return scores
+
+    def top_k(self, scores, k, threshold=0):
+        """Indices of the k best scores >= threshold, best first"""
+        candidates = np.flatnonzero(scores >= threshold)
+        if len(candidates) > k:
+            part = np.argpartition(-scores[candidates], k - 1)[:k]
+            candidates = candidates[part]
+        return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+    def nearest_rows(self, query, key, k, rows=None):
+        """Rows (of all or the given rows) of the k smallest Hamming distances for one hash type, sorted"""
+        distances = self.distances(query, key, rows)
+        if rows is None:
+            rows = np.arange(len(distances))
+        if len(distances) <= k:
+            return rows
+        return np.sort(rows[np.argpartition(distances, k - 1)[:k]])
+
+    def sign_matrix(self, key):
+        """+1/-1 bit matrix of one hash type, unpacked on first batch search"""
+        if key not in self._sign_matrices:
+            self._sign_matrices[key] = unpack_sign_bits(self.matrices[key])
+        return self._sign_matrices[key]
+
+    def field_codes(self, field):
+        """({value: code}, (R,) code of every row) for one item field, built on first use"""
+        if field not in self._field_codes:
+            values, codes = np.unique(
+                np.array([row.get(field) or "" for row in self.rows], dtype=object), return_inverse=True
+            )
+            self._field_codes[field] = ({value: code for code, value in enumerate(values)}, codes)
+        return self._field_codes[field]
+
+    def scope_rows(self, scope=None):
+        """
+        Sorted fingerprint rows of items matching one of the values of every
+        scope field, None for an unscoped scan. The row mask is computed once per scope
+        """
+        scope = normalize_scope(scope)
+        if not scope:
+            return None
+
+        key = tuple((field, tuple(values)) for field, values in sorted(scope.items()))
+        if key not in self._scope_rows:
+            mask = np.ones(len(self.rows), dtype=bool)
+            for field, values in scope.items():
+                positions, codes = self.field_codes(field)
+                mask &= np.isin(codes, [positions[value] for value in values if value in positions])
+            self._scope_rows[key] = np.flatnonzero(mask)
+        return self._scope_rows[key]
+
+    def item_count(self, rows=None):
+        """Number of items with a fingerprint among rows (all items without rows)"""
+        if rows is None:
+            return len(self.items)
+        return len(np.unique(self.row_items[rows]))
+
+    def radius_candidates(self, query, radius=DEFAULT_MIH_RADIUS):
+        """Rows whose pHash is within Hamming radius of the query (sub-linear lookup)"""
+        if self._mih is None:
+            self._mih = MultiIndexHash(self.matrices["phash"])
+        rows = self._mih.candidates(query["phash"], radius)
+        return rows[self.distances(query, "phash", rows) <= radius]
+
+
+def normalize_scope(scope=None):
+    """
+    Scope filters (dict or JSON) reduced to {field: [values]} of the set SCOPE_FIELDS
+    An Item Group also matches its descendant groups; an already normalized
+    scope is returned unchanged
+    """
+    if isinstance(scope, str):
+        scope = frappe.parse_json(scope)
+
+    normalized = {}
+    for field in SCOPE_FIELDS:
+        value = scope.get(field) if scope else None
+        if not value:
+            continue
+        if isinstance(value, (list, tuple)):
+            normalized[field] = list(value)
+        elif field == "item_group":
+            normalized[field] = get_item_group_subtree(value)
+        else:
+            normalized[field] = [value]
+    return normalized
+
+
+def get_item_group_subtree(item_group):
+    """An Item Group and all groups below it (nested set lft/rgt)"""
+    from frappe.utils.nestedset import get_descendants_of
+
+    return [item_group, *get_descendants_of("Item Group", item_group, ignore_permissions=True)]
+
+
+def filter_scope(rows, scope=None):
+    """Rows (items or photo entries with the SCOPE_FIELDS) matching one of the values of every scope field"""
+    scope = normalize_scope(scope)
+    if not scope:
+        return rows
+    return [row for row in rows if all(row.get(field) in values for field, values in scope.items())]
+
+
+def group_rows_by_item(rows):
+    """
+    Unique items (first row of each) and the item index of every row
+    Rows without a name (query fingerprints) are items of their own
+    """
+    items = []
+    positions = {}
+    row_items = np.empty(len(rows), dtype=np.int64)
+    for idx, row in enumerate(rows):
+        key = row.get("name")
+        if key is None:
+            key = ("row", idx)
+        if key not in positions:
+            positions[key] = len(items)
+            items.append(row)
+        row_items[idx] = positions[key]
+    return items, row_items
+
+
+def score_distances(distances, whash_valid=None, color_similarity=None, color_valid=None, color_weight=0):
+    """
+    Vectorized score_hash_distances over Hamming distance arrays of any shape
+    whash counts only where whash_valid; the colour blend only where color_valid
+    """
+    sims = {}
+    for key in ("ahash", "phash", "dhash"):
+        sims[key] = np.maximum(0, 100 - distances[key] * (100 / HASH_BITS[key]))
+
+    if whash_valid is not None:
+        whash_sim = np.maximum(0, 100 - distances["whash"] * (100 / HASH_BITS["whash"]))
+        whash_sim = np.where(whash_valid, whash_sim, 0)
+    else:
+        whash_sim = 0
+
+    final_score = (
+        sims["ahash"] * HASH_WEIGHTS["ahash"] +
+        sims["phash"] * HASH_WEIGHTS["phash"] +
+        sims["dhash"] * HASH_WEIGHTS["dhash"] +
+        whash_sim * HASH_WEIGHTS["whash"]
+    )
+
+    # Bonus for high agreement
+    bonus = (sims["ahash"] > 90) & (sims["phash"] > 90) & (sims["dhash"] > 90)
+    final_score = np.where(bonus, np.minimum(100, final_score + 5), final_score)
+
+    if color_weight and color_similarity is not None:
+        blended = blend_color_similarity(final_score, color_similarity, color_weight)
+        final_score = np.where(color_valid, blended, final_score)
+
+    return np.round(final_score, 2)
+
+
+def band_count(words):
+    """Number of MIH_CHUNK_BITS substrings (bands) of packed (..., W) uint64 hashes"""
+    return words.shape[-1] * (64 // MIH_CHUNK_BITS)
+
+
+def band_values(words, band):
+    """Substring number band of packed (..., W) uint64 hashes as uint16, most significant bits first"""
+    word, part = divmod(band, 64 // MIH_CHUNK_BITS)
+    shift = np.uint64(64 - MIH_CHUNK_BITS * (part + 1))
+    return ((words[..., word] >> shift) & np.uint64((1 << MIH_CHUNK_BITS) - 1)).astype(np.uint16)
+
+
+class MultiIndexHash:
+    """
+    Multi-index hashing over one packed hash matrix
+    The hash is split into 16-bit substrings with one sorted table each. Any item
+    within radius r of the query matches the query within r // chunks bits in at
+    least one substring (pigeonhole), so only those buckets are probed.
+    """
+
+    def __init__(self, matrix):
+        self.num_chunks = band_count(matrix)
+        self.tables = []
+        for chunk in range(self.num_chunks):
+            values = band_values(matrix, chunk)
+            order = np.argsort(values, kind="stable")
+            self.tables.append((values[order], order))
+        self._probe_masks = {}
+
+    def probe_masks(self, chunk_radius):
+        """All 16-bit masks with at most chunk_radius bits set"""
+        if chunk_radius not in self._probe_masks:
+            masks = [0]
+            for bits in range(1, chunk_radius + 1):
+                for positions in combinations(range(MIH_CHUNK_BITS), bits):
+                    masks.append(sum(1 << p for p in positions))
+            self._probe_masks[chunk_radius] = np.array(masks, dtype=np.uint16)
+        return self._probe_masks[chunk_radius]
+
+    def candidates(self, query_words, radius):
+        """Unique row indices sharing a near-identical substring with the query"""
+        masks = self.probe_masks(min(radius // self.num_chunks, MIH_CHUNK_BITS))
+        found = []
+        for chunk, (sorted_values, order) in enumerate(self.tables):
+            probes = np.bitwise_xor(band_values(query_words, chunk), masks)
+            lo = np.searchsorted(sorted_values, probes, side="left")
+            hi = np.searchsorted(sorted_values, probes, side="right")
+            for start, end in zip(lo[lo < hi], hi[lo < hi], strict=True):
+                found.append(order[start:end])
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(found))
+
+
+def near_duplicate_pairs(search_index, max_distance=DEFAULT_DUPLICATE_DISTANCE, key="phash"):
+    """
+    All row pairs (i < j) whose hashes differ in at most max_distance bits
+    Blocking on 16-bit bands: with max_distance < number of bands, any such pair
+    has at least one identical band (pigeonhole), so only rows sharing a band
+    value are compared. Returns (left rows, right rows, distances).
+    """
+    matrix = search_index.matrices[key]
+    valid = np.flatnonzero(search_index.valid[key])
+    valid_matrix = matrix[valid]
+
+    blocks = []
+    for band in range(band_count(valid_matrix)):
+        values = band_values(valid_matrix, band)
+        order = np.argsort(values, kind="stable")
+        sorted_values = values[order]
+
+        # Bucket size at every sorted position; oversized buckets (blank or
+        # placeholder images share bands with everything) are left out
+        starts = np.flatnonzero(np.r_[True, sorted_values[1:] != sorted_values[:-1]])
+        sizes = np.diff(np.r_[starts, len(order)])
+        bucket_size = np.repeat(sizes, sizes)
+        usable = bucket_size <= MAX_DUPLICATE_BUCKET
+        largest = int(bucket_size[usable].max()) if usable.any() else 1
+
+        # Positions k apart in the sorted order are in one bucket when equal
+        for offset in range(1, largest):
+            same = (sorted_values[:-offset] == sorted_values[offset:]) & usable[offset:]
+            if not same.any():
+                continue
+            first, second = order[:-offset][same], order[offset:][same]
+            blocks.append(np.minimum(first, second) * len(valid) + np.maximum(first, second))
+
+    if not blocks:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+
+    pair_codes = np.unique(np.concatenate(blocks))
+    left, right = valid[pair_codes // len(valid)], valid[pair_codes % len(valid)]
+    distances = popcount_rows(np.bitwise_xor(matrix[left], matrix[right])).astype(np.int64)
+
+    close = distances <= max_distance
+    return left[close], right[close], distances[close]
+
+
+def merge_ranked(scored, limit):
+    """[(item, score)] from several indexes -> best score per item_code, best first, at most limit"""
+    best = {}
+    for item, score in scored:
+        if item.item_code not in best or score > best[item.item_code][1]:
+            best[item.item_code] = (item, score)
+    return sorted(best.values(), key=lambda entry: entry[1], reverse=True)[:limit]
+
+
+def top_k_rows(scores, k, threshold=0):
+    """Per query row: column indices of the k best scores >= threshold, best first"""
+    if scores.shape[1] > k:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+
+    results = []
+    for row, columns in zip(scores, candidates, strict=True):
+        columns = columns[row[columns] >= threshold]
+        results.append(columns[np.argsort(-row[columns], kind="stable")])
+    return results
+
+
+def get_search_index():
+    """
+    Matrix index for the current site, reloaded when the fingerprint index version changes
+    Mapped from the shared on-disk store when another worker already wrote this
+    version, otherwise built from the fingerprint table and written for the others
+    """
+    from shreerakhi_customizations.shree import image_store
+
+    site = getattr(frappe.local, "site", None)
+    version = get_index_version()
+
+    cached = _search_index_cache.get(site)
+    if cached is not None and cached.version == version:
+        return cached
+
+    stored = image_store.read_store(version)
+    if stored:
+        rows, arrays = stored
+        search_index = HashMatrixIndex(rows, version=version, arrays=arrays)
+    else:
+        search_index = HashMatrixIndex(get_indexed_items(), version=version)
+        image_store.write_store(search_index, version)
+
+    _search_index_cache[site] = search_index
+    return search_index
+
+
+def get_search_mode(search_mode=None):
+    """Requested search mode, else site config image_match_search_mode, else brute"""
+    search_mode = search_mode or frappe.conf.get("image_match_search_mode") or "brute"
+    if search_mode not in SEARCH_MODES:
+        frappe.throw(f"Unknown image search mode: {search_mode}")
+    return search_mode
+
+
+def get_color_weight():
+    """Colour signature share of the score - site config image_match_color_weight"""
+    color_weight = frappe.conf.get("image_match_color_weight")
+    if color_weight is None:
+        return DEFAULT_COLOR_WEIGHT
+    return min(1.0, max(0.0, float(color_weight)))
+
+
+def get_cascade_shortlist(shortlist=None):
+    """Stage 1 shortlist size - site config image_match_cascade_shortlist"""
+    return max(1, int(shortlist or frappe.conf.get("image_match_cascade_shortlist") or DEFAULT_CASCADE_SHORTLIST))
+
+
+def search(search_index, query, threshold, limit, search_mode="brute", radius=None, shortlist=None, scope=None):
+    """
+    Ranked (item index, score) pairs above threshold plus matched/candidate counts
+    and per-stage timings in milliseconds
+    Every fingerprint row is scored, items take their best row
+    scope: {field: value} of SCOPE_FIELDS, only rows of matching items are scored
+    """
+    start = time.perf_counter()
+    scope_rows = search_index.scope_rows(scope)
+    if search_mode == "mih":
+        rows = search_index.radius_candidates(
+            query, radius or frappe.conf.get("image_match_mih_radius") or DEFAULT_MIH_RADIUS
+        )
+        if scope_rows is not None:
+            rows = np.intersect1d(rows, scope_rows, assume_unique=True)
+    elif search_mode == "cascade":
+        rows = search_index.nearest_rows(query, "dhash", max(get_cascade_shortlist(shortlist), limit), scope_rows)
+    else:
+        rows = scope_rows
+    candidates_done = time.perf_counter()
+
+    scores = search_index.best_per_item(search_index.scores(query, rows, color_weight=get_color_weight()), rows)
+    top = search_index.top_k(scores, limit, threshold)
+    scored = time.perf_counter()
+
+    timings = {"score_ms": round((scored - candidates_done) * 1000, 3)}
+    if search_mode != "brute":
+        timings["candidates_ms"] = round((candidates_done - start) * 1000, 3)
+
+    return {
+        "results": [(int(idx), float(scores[idx])) for idx in top],
+        "matched_count": int((scores >= threshold).sum()),
+        "candidate_count": len(search_index.rows) if rows is None else len(rows),
+        "timings": timings,
+    }
+
+
+def benchmark_search_modes(sizes=(1000, 10000, 50000), queries=50, noise_bits=16, radius=DEFAULT_MIH_RADIUS):
+    """
+    Compare brute force, multi-index hashing and the dHash cascade on synthetic hashes
+    Queries are catalogue items with noise_bits flipped in every hash
+    Run with: bench execute shreerakhi_customizations.shree.image_search.benchmark_search_modes
+    """
+    rng = np.random.default_rng(42)
+    results = []
+
+    for size in sizes:
+        rows = [
+            {key: rng.bytes(bits // 8).hex() for key, bits in HASH_BITS.items()}
+            for _ in range(size)
+        ]
+        search_index = HashMatrixIndex(rows)
+        search_index.radius_candidates(pack_hashes(rows[0]), radius)  # build MIH tables
+
+        timings = {mode: 0.0 for mode in SEARCH_MODES}
+        hits = {mode: 0 for mode in SEARCH_MODES}
+        candidates = {mode: 0 for mode in SEARCH_MODES}
+
+        for _ in range(queries):
+            target = int(rng.integers(size))
+            query = {}
+            for key, bits in HASH_BITS.items():
+                value = int(rows[target][key], 16)
+                for bit in rng.choice(bits, noise_bits * bits // 256, replace=False):
+                    value ^= 1 << int(bit)
+                query[key] = f"{value:0{bits // 4}x}"
+            query = pack_hashes(query)
+
+            for mode in SEARCH_MODES:
+                start = time.perf_counter()
+                found = search(search_index, query, 0, 1, search_mode=mode, radius=radius)
+                timings[mode] += time.perf_counter() - start
+                if found["results"] and found["results"][0][0] == target:
+                    hits[mode] += 1
+                candidates[mode] += found["candidate_count"]
+
+        result = {"catalogue_size": size}
+        for mode in SEARCH_MODES:
+            result[f"{mode}_ms"] = round(timings[mode] * 1000 / queries, 3)
+            result[f"{mode}_recall"] = hits[mode] / queries
+            result[f"{mode}_avg_candidates"] = round(candidates[mode] / queries, 1)
+        results.append(result)
+
+    return results
@@ -0,0 +1,129 @@
+"""
+Shared Fingerprint Store
+The packed search index persisted per index version as .npy files plus an item
+sidecar under the site's private files. Every gunicorn/RQ worker memory-maps the
+same read-only files, so the matrices live once in the OS page cache and a
+restarted worker maps them instead of re-reading the fingerprint table
+Path: shreerakhi_customizations/shree/image_store.py
+"""
+
+import json
+import os
+import shutil
+
+import frappe
+import numpy as np
+
+from shreerakhi_customizations.shree.image_hashing import HASH_BITS
+
+STORE_FOLDER = "image_match_index"
+ROWS_FILE = "rows.json"
+
+# Item details kept in the sidecar - hashes live in the matrices
+ROW_FIELDS = (
+    "name", "item_code", "item_name", "image", "item_group",
+    "custom_item_range", "custom_item_category", "image_field",
+)
+
+# Bumped when the stored files change, older stores are then rebuilt on first read
+STORE_FORMAT = 2
+
+# Versions kept on disk; older ones are removed after a new version is written
+KEEP_VERSIONS = 2
+
+
+def get_store_dir():
+    store_dir = frappe.get_site_path("private", STORE_FOLDER)
+    os.makedirs(store_dir, exist_ok=True)
+    return store_dir
+
+
+def get_version_dir(version):
+    return os.path.join(get_store_dir(), f"{version}-{STORE_FORMAT}")
+
+
+def array_files(search_index):
+    """File name -> array of everything HashMatrixIndex needs"""
+    files = {"colors.npy": search_index.colors, "color_valid.npy": search_index.color_valid}
+    for key in HASH_BITS:
+        files[f"{key}.npy"] = search_index.matrices[key]
+        files[f"{key}_valid.npy"] = search_index.valid[key]
+    return files
+
+
+def write_store(search_index, version):
+    """
+    Persist an index under its version
+    Written to a temporary folder and renamed into place, so readers see a
+    complete version or none; a concurrent writer of the same version loses quietly
+    """
+    target = get_version_dir(version)
+    if os.path.exists(target):
+        return False
+
+    tmp_dir = f"{target}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(tmp_dir, exist_ok=True)
+        for name, array in array_files(search_index).items():
+            np.save(os.path.join(tmp_dir, name), np.ascontiguousarray(array))
+
+        rows = [{field: row.get(field) for field in ROW_FIELDS} for row in search_index.rows]
+        with open(os.path.join(tmp_dir, ROWS_FILE), "w") as f:
+            json.dump(rows, f, separators=(",", ":"))
+
+        os.rename(tmp_dir, target)
+    except OSError as e:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if not os.path.exists(target):
+            frappe.logger().warning(f"Could not write image index store {version}: {e}")
+        return False
+
+    remove_old_versions(keep=os.path.basename(target))
+    return True
+
+
+def read_store(version):
+    """
+    (rows, arrays) of a stored version with the arrays memory-mapped read-only,
+    None if this version was not written yet
+    """
+    version_dir = get_version_dir(version)
+    if not os.path.exists(os.path.join(version_dir, ROWS_FILE)):
+        return None
+
+    try:
+        with open(os.path.join(version_dir, ROWS_FILE)) as f:
+            rows = [frappe._dict(row) for row in json.load(f)]
+
+        def load(name):
+            return np.load(os.path.join(version_dir, name), mmap_mode="r")
+
+        arrays = {
+            "matrices": {key: load(f"{key}.npy") for key in HASH_BITS},
+            "valid": {key: load(f"{key}_valid.npy") for key in HASH_BITS},
+            "colors": load("colors.npy"),
+            "color_valid": load("color_valid.npy"),
+        }
+    except (OSError, ValueError) as e:
+        # Removed by a newer writer between exists() and open - caller rebuilds
+        frappe.logger().warning(f"Could not read image index store {version}: {e}")
+        return None
+
+    return rows, arrays
+
+
+def remove_old_versions(keep=None):
+    """
+    Delete all but the KEEP_VERSIONS newest versions
+    Workers still mapping a deleted version keep their pages until they reload
+    """
+    store_dir = get_store_dir()
+    versions = []
+    with os.scandir(store_dir) as it:
+        for entry in it:
+            if entry.is_dir() and not entry.name.endswith(".tmp"):
+                versions.append((entry.stat().st_mtime, entry.name))
+
+    for _, name in sorted(versions, reverse=True)[KEEP_VERSIONS:]:
+        if name != keep:
+            shutil.rmtree(os.path.join(store_dir, name), ignore_errors=True)
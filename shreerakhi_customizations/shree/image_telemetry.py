@@ -0,0 +1,129 @@
+"""
+Image Scan Telemetry
+Rolling aggregates of image scans kept in Redis: per-stage timings, a latency
+histogram, cache hits, skipped and failed counts. One hash per hour bucket,
+summed over the last image_match_telemetry_hours (default 24) on read
+Path: shreerakhi_customizations/shree/image_telemetry.py
+"""
+
+import time
+
+import frappe
+
+TELEMETRY_KEY_PREFIX = "image_match_telemetry"
+BUCKET_SECONDS = 3600
+DEFAULT_WINDOW_HOURS = 24
+
+# Stages timed by match_item_by_image, "compare" is candidates + scoring
+STAGES = ("load", "hash", "index", "compare", "enrich", "total")
+
+# Upper bounds (ms) of the total scan time histogram used for percentiles
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+def get_bucket_key(bucket):
+    return frappe.cache().make_key(f"{TELEMETRY_KEY_PREFIX}:{bucket}")
+
+
+def get_window_hours():
+    return max(1, int(frappe.conf.get("image_match_telemetry_hours") or DEFAULT_WINDOW_HOURS))
+
+
+def get_stage_timings(timings):
+    """Per-stage milliseconds of a scan result's timings"""
+    stages = {stage: timings.get(f"{stage}_ms") for stage in STAGES}
+    if "score_ms" in timings:
+        stages["compare"] = timings["score_ms"] + timings.get("candidates_ms", 0)
+    return {stage: ms for stage, ms in stages.items() if ms is not None}
+
+
+def latency_field(total_ms):
+    for bound in LATENCY_BUCKETS_MS:
+        if total_ms <= bound:
+            return f"le_{bound}"
+    return "le_inf"
+
+
+def record_scan(result):
+    """
+    Add one scan result of match_item_by_image to the current hour bucket
+    Never raises - telemetry must not fail a scan
+    """
+    try:
+        timings = result.get("timings") or {}
+        fields = {
+            "scans": 1,
+            "failed": 0 if result.get("success") else 1,
+            "cache_hits": 1 if result.get("cached") else 0,
+            "skipped": result.get("skipped_count") or 0,
+        }
+        if result.get("search_mode"):
+            fields[f"mode:{result['search_mode']}"] = 1
+
+        stages = get_stage_timings(timings)
+        for stage, ms in stages.items():
+            fields[f"sum_{stage}_ms"] = ms
+            fields[f"count_{stage}"] = 1
+        if "total" in stages:
+            fields[latency_field(stages["total"])] = 1
+
+        # Raw Redis pipeline: plain numeric fields that HINCRBYFLOAT can add to
+        key = get_bucket_key(int(time.time() // BUCKET_SECONDS))
+        pipe = frappe.cache().pipeline()
+        for field, amount in fields.items():
+            if amount:
+                pipe.hincrbyfloat(key, field, amount)
+        pipe.expire(key, (get_window_hours() + 1) * BUCKET_SECONDS)
+        pipe.execute()
+    except Exception as e:
+        frappe.logger().warning(f"Image scan telemetry not recorded: {e}")
+
+
+def get_scan_telemetry(hours=None):
+    """Aggregates of the last hours buckets: rates, average stage times, p50/p95 total time"""
+    hours = hours or get_window_hours()
+    current = int(time.time() // BUCKET_SECONDS)
+
+    pipe = frappe.cache().pipeline()
+    for bucket in range(current - hours + 1, current + 1):
+        pipe.hgetall(get_bucket_key(bucket))
+
+    totals = {}
+    for values in pipe.execute():
+        for field, value in values.items():
+            field = field.decode() if isinstance(field, bytes) else field
+            totals[field] = totals.get(field, 0) + float(value)
+
+    scans = int(totals.get("scans", 0))
+    telemetry = {
+        "window_hours": hours,
+        "scans": scans,
+        "scans_per_hour": round(scans / hours, 2),
+        "failed": int(totals.get("failed", 0)),
+        "cache_hits": int(totals.get("cache_hits", 0)),
+        "skipped": int(totals.get("skipped", 0)),
+        "search_modes": {
+            field.split(":", 1)[1]: int(count) for field, count in totals.items() if field.startswith("mode:")
+        },
+        "avg_ms": {
+            stage: round(totals[f"sum_{stage}_ms"] / totals[f"count_{stage}"], 1)
+            for stage in STAGES if totals.get(f"count_{stage}")
+        },
+        "p50_ms": None,
+        "p95_ms": None,
+    }
+    telemetry["failure_rate"] = round(telemetry["failed"] / scans * 100, 1) if scans else None
+    telemetry["cache_hit_rate"] = round(telemetry["cache_hits"] / scans * 100, 1) if scans else None
+
+    # Percentiles as the upper bound of the histogram bucket reaching them
+    timed = totals.get("count_total", 0)
+    if timed:
+        for name, share in (("p50_ms", 0.5), ("p95_ms", 0.95)):
+            seen = 0
+            for bound in (*LATENCY_BUCKETS_MS, None):
+                seen += totals.get(f"le_{bound or 'inf'}", 0)
+                if seen >= share * timed:
+                    telemetry[name] = bound if bound else f">{LATENCY_BUCKETS_MS[-1]}"
+                    break
+
+    return telemetry
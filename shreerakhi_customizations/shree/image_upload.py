@@ -0,0 +1,85 @@
+"""
+Scanner Upload Guard
+Photos attached to the Item Image Scanner are downscaled once, right after
+upload, when they are larger than image_scan_upload_max_edge (default 1024 px).
+The file keeps its name and format, so its URL and extension stay valid.
+The browser already resizes before uploading; this covers older clients and
+the plain attach field, so scans never decode a full-resolution camera photo
+Path: shreerakhi_customizations/shree/image_upload.py
+"""
+
+import hashlib
+import os
+from io import BytesIO
+
+import frappe
+from PIL import Image, ImageOps
+
+SCANNER_DOCTYPE = "Item Image Scanner"
+DEFAULT_UPLOAD_MAX_EDGE = 1024
+UPLOAD_JPEG_QUALITY = 85
+# Camera JPEGs (MPO is JPEG with extra frames) are re-encoded as plain JPEG
+JPEG_FORMATS = ("JPEG", "MPO")
+
+
+def get_upload_max_edge():
+    return max(256, int(frappe.conf.get("image_scan_upload_max_edge") or DEFAULT_UPLOAD_MAX_EDGE))
+
+
+def on_file_insert(doc, method=None):
+    """File after_insert: shrink oversized scanner photos in place"""
+    if doc.attached_to_doctype != SCANNER_DOCTYPE or doc.is_folder or not doc.file_url:
+        return
+
+    # Deduplicated uploads share the file on disk - never rewrite someone else's file
+    if frappe.db.exists("File", {"file_url": doc.file_url, "name": ["!=", doc.name]}):
+        return
+
+    try:
+        normalize_upload(doc)
+    except Exception as e:
+        # The scan still works on the original file
+        frappe.log_error(f"Scanner upload normalize error: {e}")
+
+
+def normalize_upload(doc):
+    """
+    Downscale the file of a File doc to the max edge, in its original format
+    Returns True when the file was rewritten
+    """
+    path = doc.get_full_path()
+    max_edge = get_upload_max_edge()
+
+    with Image.open(path) as img:
+        # Header only so far - small uploads are not decoded
+        if max(img.size) <= max_edge:
+            return False
+
+        fmt = img.format
+        Image.init()
+        if fmt not in Image.SAVE:
+            return False
+
+        # Phone photos are stored sideways with an EXIF rotation
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+        buffer = BytesIO()
+        if fmt in JPEG_FORMATS:
+            if img.mode != "RGB":
+                img = img.convert("RGB")
+            img.save(buffer, "JPEG", quality=UPLOAD_JPEG_QUALITY, optimize=True)
+        else:
+            img.save(buffer, fmt, optimize=True)
+
+    content = buffer.getvalue()
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+    doc.db_set({
+        "file_size": len(content),
+        "content_hash": hashlib.md5(content).hexdigest(),
+    }, update_modified=False)
+    return True
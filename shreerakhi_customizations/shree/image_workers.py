@@ -0,0 +1,71 @@
+"""
+Parallel Image Workers
+Process pool for CPU-bound image decoding and hashing in background index builds
+Path: shreerakhi_customizations/shree/image_workers.py
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+
+import frappe
+
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_BATCH_SIZE = 64
+
+
+def get_worker_count():
+    """
+    Hashing processes - site config image_match_workers
+    Defaults to the CPU count (max 8); 1 disables the pool
+    """
+    workers = frappe.conf.get("image_match_workers")
+    if workers is None:
+        workers = min(os.cpu_count() or 1, DEFAULT_MAX_WORKERS)
+    return max(1, int(workers))
+
+
+@contextmanager
+def image_pool(max_workers=None):
+    """
+    ProcessPoolExecutor for image work, or None when running serially
+    Worker functions must not call frappe (see image_hashing.py)
+    """
+    max_workers = max_workers or get_worker_count()
+    if max_workers <= 1:
+        yield None
+        return
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        yield executor
+
+
+def run_isolated(func, item):
+    """Call func(item) -> (result, None), or (None, error message) if it raised"""
+    try:
+        return func(item), None
+    except Exception as e:
+        return None, str(e)
+
+
+def map_isolated(func, items, executor=None, batch_size=None):
+    """
+    Apply func to every item, yielding (result, error) in input order
+    Items are sent to the pool in batches, each split into chunks per worker,
+    so a failing image only marks its own entry
+    """
+    items = list(items)
+    if not items:
+        return
+
+    task = partial(run_isolated, func)
+    if executor is None:
+        yield from map(task, items)
+        return
+
+    batch_size = batch_size or int(frappe.conf.get("image_match_batch_size") or DEFAULT_BATCH_SIZE)
+    chunksize = max(1, batch_size // (get_worker_count() * 2))
+
+    for start in range(0, len(items), batch_size):
+        yield from executor.map(task, items[start:start + batch_size], chunksize=chunksize)
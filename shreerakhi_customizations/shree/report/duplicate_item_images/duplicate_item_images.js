@@ -0,0 +1,34 @@
+// Copyright (c) 2026, atul and contributors
+// For license information, please see license.txt
+
+frappe.query_reports["Duplicate Item Images"] = {
+    filters: [
+        {
+            fieldname: "max_distance",
+            label: __("Max pHash Distance"),
+            fieldtype: "Int",
+            default: 12,
+            description: __("Bits of 256 that may differ (0 = identical photo, max 15)")
+        },
+        {
+            fieldname: "item_group",
+            label: __("Item Group"),
+            fieldtype: "Link",
+            options: "Item Group"
+        },
+        {
+            fieldname: "item_range",
+            label: __("Item Range"),
+            fieldtype: "Link",
+            options: "Item Range"
+        }
+    ],
+
+    formatter: function(value, row, column, data, default_formatter) {
+        value = default_formatter(value, row, column, data);
+        if (column.fieldname === "distance" && data && data.distance === 0) {
+            value = `<span style="color: #e74c3c; font-weight: bold;">${value}</span>`;
+        }
+        return value;
+    }
+};
@@ -0,0 +1,135 @@
+# Copyright (c) 2026, atul and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe import _
+from frappe.utils import cint
+
+from shreerakhi_customizations.shree.image_search import (
+    DEFAULT_DUPLICATE_DISTANCE,
+    get_search_index,
+    near_duplicate_pairs,
+)
+
+# Band blocking finds every pair only below the number of 16-bit pHash bands
+MAX_DISTANCE = 15
+
+
+def execute(filters=None):
+    filters = filters or {}
+    max_distance = cint(filters.get("max_distance") or DEFAULT_DUPLICATE_DISTANCE)
+    if max_distance < 0 or max_distance > MAX_DISTANCE:
+        frappe.throw(_("Max pHash Distance must be between 0 and {0}").format(MAX_DISTANCE))
+
+    columns = [
+        {"label": "Cluster", "fieldname": "cluster", "fieldtype": "Int", "width": 70},
+        {"label": "Image", "fieldname": "image_link", "fieldtype": "HTML", "width": 90},
+        {"label": "Item Code", "fieldname": "item_code", "fieldtype": "Link", "options": "Item", "width": 140},
+        {"label": "Item Name", "fieldname": "item_name", "fieldtype": "Data", "width": 160},
+        {"label": "Item Range", "fieldname": "item_range", "fieldtype": "Link", "options": "Item Range", "width": 110},
+        {"label": "Item Group", "fieldname": "item_group", "fieldtype": "Link", "options": "Item Group", "width": 120},
+        {"label": "Stock Qty", "fieldname": "stock_qty", "fieldtype": "Float", "width": 90},
+        {"label": "Closest Item", "fieldname": "closest_item", "fieldtype": "Link", "options": "Item", "width": 140},
+        {"label": "pHash Distance", "fieldname": "distance", "fieldtype": "Int", "width": 110},
+    ]
+
+    search_index = get_search_index()
+    left, right, distances = near_duplicate_pairs(search_index, max_distance)
+
+    # Fingerprint rows -> items; front and back photo of one item are not duplicates
+    left, right = search_index.row_items[left], search_index.row_items[right]
+    different = left != right
+    clusters = build_clusters(left[different].tolist(), right[different].tolist(), distances[different].tolist())
+    if not clusters:
+        return columns, []
+
+    rows = search_index.items
+    item_codes = list({rows[row].item_code for members in clusters for row, *pair in members})
+    details = get_item_details(item_codes)
+
+    item_group = filters.get("item_group")
+    item_range = filters.get("item_range")
+
+    data = []
+    cluster = 0
+    for members in clusters:
+        codes = [rows[row].item_code for row, *pair in members]
+        if item_group and not any(details.get(code, {}).get("item_group") == item_group for code in codes):
+            continue
+        if item_range and not any(details.get(code, {}).get("item_range") == item_range for code in codes):
+            continue
+
+        cluster += 1
+        for row, closest, distance in members:
+            item = rows[row]
+            info = details.get(item.item_code, {})
+            data.append({
+                "cluster": cluster,
+                "image_link": f'<img src="{item.image}" style="height: 40px;">' if item.image else "",
+                "item_code": item.item_code,
+                "item_name": item.item_name,
+                "item_range": info.get("item_range"),
+                "item_group": item.item_group,
+                "stock_qty": info.get("stock_qty", 0),
+                "closest_item": rows[closest].item_code,
+                "distance": distance,
+            })
+
+    return columns, data
+
+
+def build_clusters(left, right, distances):
+    """
+    Union-find over near-duplicate pairs
+    Returns clusters (largest first) of [(row, closest row, distance)]
+    """
+    parent = {}
+
+    def find(row):
+        parent.setdefault(row, row)
+        while parent[row] != row:
+            parent[row] = parent[parent[row]]
+            row = parent[row]
+        return row
+
+    closest = {}
+    for a, b, distance in zip(left, right, distances, strict=True):
+        parent[find(a)] = find(b)
+        for row, other in ((a, b), (b, a)):
+            if row not in closest or distance < closest[row][1]:
+                closest[row] = (other, distance)
+
+    groups = {}
+    for row in closest:
+        groups.setdefault(find(row), []).append((row, *closest[row]))
+
+    return sorted(
+        (sorted(members) for members in groups.values()),
+        key=lambda members: (-len(members), members[0][0])
+    )
+
+
+def get_item_details(item_codes):
+    """Range, group and total stock of the clustered items, one query each"""
+    if not item_codes:
+        return {}
+
+    details = {
+        row.name: {"item_range": row.custom_item_range, "item_group": row.item_group, "stock_qty": 0}
+        for row in frappe.get_all(
+            "Item",
+            filters={"name": ["in", item_codes]},
+            fields=["name", "custom_item_range", "item_group"]
+        )
+    }
+
+    for row in frappe.db.sql("""
+        SELECT item_code, SUM(actual_qty) AS stock_qty
+        FROM `tabBin`
+        WHERE item_code IN %(item_codes)s
+        GROUP BY item_code
+    """, {"item_codes": tuple(item_codes)}, as_dict=1):
+        if row.item_code in details:
+            details[row.item_code]["stock_qty"] = row.stock_qty or 0
+
+    return details
@@ -0,0 +1,73 @@
+# Copyright (c) 2026, atul and Contributors
+# See license.txt
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import ClassVar
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from shreerakhi_customizations.shree.image_fetch import failure_cache_key, fetch_images
+
+IMAGE_BYTES = b"\x89PNG\r\n\x1a\nstand-in"
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+	"""Local stand-in for an external image host"""
+
+	requests_seen: ClassVar[list] = []
+
+	def do_GET(self):
+		StandInHandler.requests_seen.append(self.path)
+		if self.path == "/rakhi.png":
+			self.send_response(200)
+			self.send_header("Content-Type", "image/png")
+			self.send_header("Content-Length", str(len(IMAGE_BYTES)))
+			self.end_headers()
+			self.wfile.write(IMAGE_BYTES)
+		else:
+			self.send_response(404)
+			self.send_header("Content-Length", "0")
+			self.end_headers()
+
+	def log_message(self, *args):
+		pass
+
+
+class TestImageFetch(FrappeTestCase):
+	@classmethod
+	def setUpClass(cls):
+		super().setUpClass()
+		cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+		threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+		cls.base_url = f"http://127.0.0.1:{cls.server.server_port}"
+
+	@classmethod
+	def tearDownClass(cls):
+		cls.server.shutdown()
+		cls.server.server_close()
+		super().tearDownClass()
+
+	def setUp(self):
+		StandInHandler.requests_seen.clear()
+		self.ok_url = f"{self.base_url}/rakhi.png"
+		self.missing_url = f"{self.base_url}/missing.png"
+
+	def tearDown(self):
+		for url in (self.ok_url, self.missing_url):
+			frappe.cache().delete_value(failure_cache_key(url))
+
+	def test_fetch_images(self):
+		results = fetch_images([self.ok_url, self.missing_url, self.ok_url])
+
+		self.assertEqual(results[self.ok_url], IMAGE_BYTES)
+		self.assertIsNone(results[self.missing_url])
+		# Duplicate URLs are fetched once
+		self.assertEqual(StandInHandler.requests_seen.count("/rakhi.png"), 1)
+
+	def test_failed_urls_are_negatively_cached(self):
+		fetch_images([self.missing_url])
+		fetch_images([self.missing_url])
+
+		self.assertEqual(StandInHandler.requests_seen.count("/missing.png"), 1)